@@ -3,16 +3,29 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-import io
-import hashlib
-import sqlite3
-import os
+
+from banco import (
+    UNIDADES, FORMAS_PAGAMENTO, CATEGORIAS_GASTO,
+    init_database, verificar_login,
+    inserir_entrada, inserir_saida, inserir_gasto, inserir_produto,
+    excluir_entrada, excluir_saida, excluir_gasto,
+    calcular_estoque_atual, calcular_estoque_em, consultar_estoque, carregar_historico, HISTORICOS, inserir_pedido, EstoqueInsuficiente,
+    carregar_resumo_periodo, carregar_resumo_produtos, carregar_resumo_categorias,
+    GRANULARIDADES, escolher_granularidade, carregar_serie_temporal, em_cache,
+    CRITERIOS_RANKING, carregar_ranking_produtos, carregar_vendas_por_mes, carregar_vendas_por_cliente,
+    buscar_produtos, produtos_por_codigo,
+    carregar_pagina_produtos, atualizar_produtos, excluir_produtos, reajustar_precos
+)
+from cache import CACHE
+from custeio import METODOS_CUSTEIO
+from exportacao import FORMATOS, MIME_TYPES, nome_arquivo, solicitar_exportacao
+from importacao import ESQUEMAS, importar
+from perfil import medir, iniciar_execucao, spans_da_execucao, tempo_execucao_ms, gravar_spans
 
 # ==============================
 # CONFIGURAÇÃO
 # ==============================
 NOME_EMPRESA = "Maria Luiza Material de Construção"
-DB_FILE = "controle.db"
 
 st.set_page_config(
     page_title=f"{NOME_EMPRESA} - Sistema de Controle",
@@ -21,324 +34,7 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# ==============================
-# FUNÇÕES DE BANCO DE DADOS
-# ==============================
-def get_connection():
-    if USE_POSTGRES:
-        try:
-            engine = create_engine(DATABASE_URL)
-            conn = engine.connect()
-            return conn
-        except Exception as e:
-            # Isso aparece nos logs do Streamlit Cloud
-            print("ERRO AO CONECTAR NO POSTGRES:", e)
-            raise
-    else:
-        return sqlite3.connect(DATABASE_URL, check_same_thread=False)
-
-
-def init_database():
-    """Inicializa o banco de dados com as tabelas"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Tabela de usuários
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usuario TEXT UNIQUE NOT NULL,
-            senha_hash TEXT NOT NULL,
-            nome_completo TEXT,
-            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Tabela de entradas
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS entradas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data DATE NOT NULL,
-            codigo_produto TEXT NOT NULL,
-            descricao_produto TEXT NOT NULL,
-            unidade TEXT NOT NULL,
-            quantidade REAL NOT NULL,
-            fornecedor TEXT,
-            custo_unitario REAL NOT NULL,
-            custo_total REAL NOT NULL,
-            nota_fiscal TEXT,
-            forma_pagamento TEXT,
-            observacoes TEXT,
-            usuario_registro TEXT,
-            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Tabela de saídas
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS saidas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data DATE NOT NULL,
-            codigo_produto TEXT NOT NULL,
-            descricao_produto TEXT NOT NULL,
-            unidade TEXT NOT NULL,
-            quantidade REAL NOT NULL,
-            cliente TEXT,
-            preco_unitario REAL NOT NULL,
-            total_venda REAL NOT NULL,
-            nota_fiscal TEXT,
-            forma_pagamento TEXT,
-            observacoes TEXT,
-            usuario_registro TEXT,
-            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Verificar e adicionar coluna nota_fiscal em saidas se não existir
-    cursor.execute("PRAGMA table_info(saidas)")
-    colunas = [col[1] for col in cursor.fetchall()]
-    if "nota_fiscal" not in colunas:
-        cursor.execute("ALTER TABLE saidas ADD COLUMN nota_fiscal TEXT")
-        conn.commit()
-
-    # Tabela de gastos
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS gastos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data DATE NOT NULL,
-            categoria TEXT NOT NULL,
-            descricao TEXT,
-            fornecedor_beneficiario TEXT,
-            valor REAL NOT NULL,
-            forma_pagamento TEXT,
-            observacoes TEXT,
-            usuario_registro TEXT,
-            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Tabela de produtos
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS produtos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            codigo TEXT UNIQUE NOT NULL,
-            descricao TEXT NOT NULL,
-            unidade TEXT NOT NULL,
-            preco_sugerido REAL NOT NULL,
-            estoque_minimo REAL NOT NULL,
-            estoque_inicial REAL DEFAULT 0
-        )
-    """)
-
-    conn.commit()
-
-    # Inserir usuários padrão se não existirem
-    cursor.execute("SELECT COUNT(*) FROM usuarios")
-    if cursor.fetchone()[0] == 0:
-        usuarios_padrao = [
-            ("admin", hash_password("admin123"), "Administrador"),
-            ("maria", hash_password("maria2024"), "Maria Luiza"),
-            ("vitoria", hash_password("vitoria123"), "Vitória")
-        ]
-        cursor.executemany(
-            "INSERT INTO usuarios (usuario, senha_hash, nome_completo) VALUES (?, ?, ?)",
-            usuarios_padrao
-        )
-        conn.commit()
-
-    # Inserir produtos padrão se não existirem
-    cursor.execute("SELECT COUNT(*) FROM produtos")
-    if cursor.fetchone()[0] == 0:
-        produtos_padrao = [
-
-        ]
-        cursor.executemany(
-            "INSERT INTO produtos (codigo, descricao, unidade, preco_sugerido, estoque_minimo, estoque_inicial) VALUES (?, ?, ?, ?, ?, ?)",
-            produtos_padrao
-        )
-        conn.commit()
-
-    conn.close()
-
-def hash_password(password):
-    """Cria hash da senha"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verificar_login(usuario, senha):
-    """Verifica login no banco de dados"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT senha_hash, nome_completo FROM usuarios WHERE usuario = ?",
-        (usuario,)
-    )
-    result = cursor.fetchone()
-    conn.close()
-
-    if result and result[0] == hash_password(senha):
-        return True, result[1]
-    return False, None
-
-# Funções para carregar dados
-def carregar_entradas():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM entradas ORDER BY data DESC", conn)
-    conn.close()
-    return df
-
-def carregar_saidas():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM saidas ORDER BY data DESC", conn)
-    conn.close()
-    return df
-
-def carregar_gastos():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM gastos ORDER BY data DESC", conn)
-    conn.close()
-    return df
-
-def carregar_produtos():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM produtos ORDER BY codigo", conn)
-    conn.close()
-    return df
-
-# Funções para inserir dados
-def inserir_entrada(data, codigo, descricao, unidade, quantidade, fornecedor,
-                   custo_unit, custo_total, nf, forma_pag, obs, usuario):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO entradas (data, codigo_produto, descricao_produto, unidade, 
-                            quantidade, fornecedor, custo_unitario, custo_total, 
-                            nota_fiscal, forma_pagamento, observacoes, usuario_registro)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (data, codigo, descricao, unidade, quantidade, fornecedor,
-          custo_unit, custo_total, nf, forma_pag, obs, usuario))
-    conn.commit()
-    conn.close()
-
-def inserir_saida(data, codigo, descricao, unidade, quantidade, cliente,
-                 preco_unit, total, nf, forma_pag, obs, usuario):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO saidas (data, codigo_produto, descricao_produto, unidade, 
-                          quantidade, cliente, preco_unitario, total_venda, 
-                          nota_fiscal, forma_pagamento, observacoes, usuario_registro)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (data, codigo, descricao, unidade, quantidade, cliente,
-          preco_unit, total, nf, forma_pag, obs, usuario))
-    conn.commit()
-    conn.close()
-
-def inserir_gasto(data, categoria, descricao, fornecedor, valor, forma_pag, obs, usuario):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO gastos (data, categoria, descricao, fornecedor_beneficiario, 
-                          valor, forma_pagamento, observacoes, usuario_registro)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (data, categoria, descricao, fornecedor, valor, forma_pag, obs, usuario))
-    conn.commit()
-    conn.close()
-
-def inserir_produto(codigo, descricao, unidade, preco, est_min, est_inicial):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            INSERT INTO produtos (codigo, descricao, unidade, preco_sugerido, 
-                                estoque_minimo, estoque_inicial)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (codigo, descricao, unidade, preco, est_min, est_inicial))
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.IntegrityError:
-        conn.close()
-        return False
-
-# Funções para excluir dados
-def excluir_entrada(id_registro):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM entradas WHERE id = ?", (id_registro,))
-    conn.commit()
-    conn.close()
-
-def excluir_saida(id_registro):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM saidas WHERE id = ?", (id_registro,))
-    conn.commit()
-    conn.close()
-
-def excluir_gasto(id_registro):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM gastos WHERE id = ?", (id_registro,))
-    conn.commit()
-    conn.close()
-
-def excluir_produto(codigo):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM produtos WHERE codigo = ?", (codigo,))
-    conn.commit()
-    conn.close()
-
-def calcular_estoque_atual():
-    """Calcula estoque atual baseado em produtos, entradas e saídas"""
-    produtos = carregar_produtos()
-    entradas = carregar_entradas()
-    saidas = carregar_saidas()
-
-    df = produtos.copy()
-
-    # Quantidades de entradas
-    if not entradas.empty:
-        ent = entradas.groupby("codigo_produto")["quantidade"].sum().reset_index()
-        ent.columns = ["codigo", "qtd_entradas"]
-    else:
-        ent = pd.DataFrame(columns=["codigo", "qtd_entradas"])
-
-    # Quantidades de saídas
-    if not saidas.empty:
-        sai = saidas.groupby("codigo_produto")["quantidade"].sum().reset_index()
-        sai.columns = ["codigo", "qtd_saidas"]
-    else:
-        sai = pd.DataFrame(columns=["codigo", "qtd_saidas"])
-
-    df = df.merge(ent, on="codigo", how="left")
-    df = df.merge(sai, on="codigo", how="left")
-
-    df["qtd_entradas"] = df["qtd_entradas"].fillna(0)
-    df["qtd_saidas"] = df["qtd_saidas"].fillna(0)
-    df["estoque_atual"] = df["estoque_inicial"] + df["qtd_entradas"] - df["qtd_saidas"]
-
-    # Calcular valor do estoque
-    df["valor_estoque"] = 0.0
-    for i, row in df.iterrows():
-        cod = row["codigo"]
-        estoque = row["estoque_atual"]
-
-        if not entradas.empty:
-            entradas_prod = entradas[entradas["codigo_produto"] == cod]
-            if not entradas_prod.empty:
-                custo_medio = entradas_prod["custo_unitario"].mean()
-            else:
-                custo_medio = row["preco_sugerido"]
-        else:
-            custo_medio = row["preco_sugerido"]
-
-        df.at[i, "valor_estoque"] = estoque * custo_medio
-
-    return df
-
-# Inicializar banco de dados
+# Migra o banco na primeira execução do processo; depois não consulta o schema
 init_database()
 
 # ==============================
@@ -364,18 +60,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# ==============================
-# CONSTANTES
-# ==============================
-UNIDADES = ["m³", "un", "kg", "saco", "ton", "litro", "caixa", "barra", "hora"]
-FORMAS_PAGAMENTO = ["À vista", "A prazo", "Cartão débito", "Cartão crédito", "PIX", "Boleto", "Cheque"]
-CATEGORIAS_GASTO = [
-    "Peças de carro", "Combustíveis", "Salários de funcionários",
-    "Manutenção caminhões caçamba", "Manutenção retroescavadeiras",
-    "Custos de depósito – Aluguel", "Custos de depósito – Luz/Água",
-    "Custos de depósito – Outros", "Seguros", "Impostos"
-]
-
 # ==============================
 # AUTENTICAÇÃO
 # ==============================
@@ -419,6 +103,8 @@ if not st.session_state.autenticado:
     tela_login()
     st.stop()
 
+iniciar_execucao(st.session_state.usuario_logado)
+
 # ==============================
 # HEADER
 # ==============================
@@ -438,6 +124,14 @@ st.markdown("---")
 # ==============================
 # SIDEBAR
 # ==============================
+@st.fragment(run_every=1)
+def progresso_exportacao(tarefa):
+    # Só este trecho se repete enquanto o arquivo é gerado; o resto da página fica livre
+    if tarefa.terminada:
+        st.rerun()
+    texto = f"Gerando {tarefa.aba}..." if tarefa.aba else "Na fila..."
+    st.progress(tarefa.progresso, text=texto)
+
 with st.sidebar:
     st.markdown(f"### 🚚 {NOME_EMPRESA}")
     st.markdown("#### Painel de Controle")
@@ -451,61 +145,256 @@ with st.sidebar:
     st.markdown("---")
     st.subheader("📥 Exportar")
 
-    if st.button("📊 Gerar Excel", use_container_width=True):
-        output = io.BytesIO()
+    formato = st.selectbox("Formato", options=list(FORMATOS), format_func=FORMATOS.get)
+    somente_periodo = st.checkbox("Somente o período selecionado", value=False)
+
+    if st.button("📊 Gerar arquivo", use_container_width=True):
+        periodo = (data_inicial, data_final) if somente_periodo else (None, None)
+        st.session_state.exportacao = solicitar_exportacao(formato, *periodo)
+
+    tarefa = st.session_state.get("exportacao")
+    if tarefa is not None:
+        if not tarefa.terminada:
+            progresso_exportacao(tarefa)
+        elif tarefa.pronta:
+            with open(tarefa.caminho, "rb") as arquivo:
+                st.download_button(
+                    label="⬇️ Baixar arquivo",
+                    data=arquivo,
+                    file_name=nome_arquivo(tarefa.formato),
+                    mime=MIME_TYPES[tarefa.formato],
+                    use_container_width=True
+                )
+        elif tarefa.erro:
+            st.error(f"Erro na exportação: {tarefa.erro}")
+        else:
+            del st.session_state.exportacao   # arquivo substituído por uma versão mais nova
 
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            carregar_entradas().to_excel(writer, sheet_name="ENTRADAS", index=False)
-            carregar_saidas().to_excel(writer, sheet_name="SAIDAS", index=False)
-            carregar_gastos().to_excel(writer, sheet_name="GASTOS", index=False)
-            carregar_produtos().to_excel(writer, sheet_name="PRODUTOS", index=False)
-            calcular_estoque_atual().to_excel(writer, sheet_name="ESTOQUE", index=False)
+    st.markdown("---")
+    st.subheader("📤 Importar")
 
-        output.seek(0)
+    tabela_importacao = st.selectbox("Tabela", options=list(ESQUEMAS), format_func=str.capitalize)
+    arquivo_importacao = st.file_uploader("Arquivo CSV ou Excel", type=["csv", "xlsx"])
 
-        st.download_button(
-            label="⬇️ Baixar Excel",
-            data=output,
-            file_name=f"MLT_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
-        )
+    if st.button("📤 Importar arquivo", use_container_width=True, disabled=arquivo_importacao is None):
+        try:
+            inseridas, rejeitadas = importar(tabela_importacao, arquivo_importacao,
+                                             arquivo_importacao.name, st.session_state.usuario_logado)
+        except ValueError as erro:
+            st.error(str(erro))
+        else:
+            st.success(f"✅ {inseridas} linha(s) importada(s)")
+            if not rejeitadas.empty:
+                st.warning(f"⚠️ {len(rejeitadas)} linha(s) rejeitada(s)")
+                st.dataframe(rejeitadas, use_container_width=True, hide_index=True)
+
+    if st.session_state.usuario_logado == "admin":
+        st.markdown("---")
+        with st.expander("⚙️ Cache de consultas"):
+            stats = CACHE.estatisticas()
+            st.write(f"Acertos: **{stats['hits']}** | Falhas: **{stats['misses']}** "
+                     f"({stats['taxa_acerto']:.0%} de acerto)")
+            st.write(f"Itens: {stats['itens']} | Memória: {stats['bytes'] / 1024 / 1024:.1f} de "
+                     f"{stats['max_bytes'] / 1024 / 1024:.0f} MB | Descartes: {stats['descartes']}")
+            if st.button("Limpar cache", use_container_width=True):
+                CACHE.limpar()
+
+        # Preenchido no fim do script, quando todos os spans já foram medidos
+        painel_perfil = st.expander("⏱️ Perfil desta execução")
 
 # ==============================
 # CARREGAR DADOS
 # ==============================
-df_entradas = carregar_entradas()
-df_saidas = carregar_saidas()
-df_gastos = carregar_gastos()
-df_produtos = carregar_produtos()
-df_estoque = calcular_estoque_atual()
+# Cada página busca só o que mostra (as funções de banco.py usam o cache)
+def total_periodo(tabela, com_nota=None):
+    """Valor do período somado dos resumos diários"""
+    resumo_periodo = carregar_resumo_periodo(data_inicial, data_final)
+    linhas = resumo_periodo[resumo_periodo["tabela"] == tabela]
+    if com_nota is not None:
+        linhas = linhas[linhas["com_nota"] == int(com_nota)]
+    return float(linhas["valor"].sum())
 
 # ==============================
-# TABS
+# HISTÓRICO PAGINADO
 # ==============================
-tab_dash, tab_ent, tab_sai, tab_gas, tab_prod, tab_est, tab_cmp, tab_rel = st.tabs([
-    "📊 Dashboard", "📦 Entradas", "🚚 Saídas", "💸 Gastos",
-    "📋 Produtos", "📦 Estoque", "🧾 Compras/Vendas (Notas)", "📈 Relatórios"
-])
+TAMANHO_PAGINA = 20
+TAMANHO_PAGINA_CATALOGO = 50
+FILTRO_NOTA = {None: "Todas", True: "Com nota", False: "Sem nota"}
+
+def mostrar_historico(tabela, prefixo, rotulo_pessoa, descrever, excluir, msg_vazio):
+    """Histórico com filtros, buscando do banco só a página visível"""
+    colunas = HISTORICOS[tabela]
+    f1, f2, f3, f4 = st.columns(4)
+    produto = f1.text_input("Código do produto", key=f"hist_prod_{prefixo}") if colunas["produto"] else ""
+    pessoa = f2.text_input(rotulo_pessoa, key=f"hist_pessoa_{prefixo}")
+    nota = f3.text_input("Nota fiscal", key=f"hist_nf_{prefixo}") if colunas["nota"] else ""
+    com_nota = f4.selectbox("Com/sem nota", options=list(FILTRO_NOTA), format_func=FILTRO_NOTA.get,
+                            key=f"hist_com_nota_{prefixo}") if colunas["nota"] else None
+
+    # Pilha de cursores (data, id) das páginas já visitadas; volta ao início se o filtro mudar
+    filtros = (produto.strip(), pessoa.strip(), nota.strip(), com_nota)
+    estado = st.session_state.setdefault(f"hist_{prefixo}", {"filtros": filtros, "cursores": [None]})
+    if estado["filtros"] != filtros:
+        estado["filtros"] = filtros
+        estado["cursores"] = [None]
+
+    pagina, proximo = carregar_historico(
+        tabela, limite=TAMANHO_PAGINA, apos=estado["cursores"][-1],
+        codigo_produto=filtros[0], pessoa=filtros[1], nota_fiscal=filtros[2], com_nota=filtros[3]
+    )
+
+    if not pagina.empty:
+        with medir(f"historico.{prefixo}", linhas=len(pagina)):
+            for _, row in pagina.iterrows():
+                col_data, col_delete = st.columns([10, 1])
+                with col_data:
+                    st.write(descrever(row))
+                with col_delete:
+                    if st.button("🗑️", key=f"del_{prefixo}_{row['id']}"):
+                        excluir(int(row['id']))
+                        st.success("Excluído!")
+                        st.rerun()
+
+        st.dataframe(pagina, use_container_width=True, height=300)
+    else:
+        st.info(msg_vazio)
+
+    c_ant, c_pag, c_prox = st.columns([1, 4, 1])
+    if c_ant.button("⬅️ Anterior", key=f"ant_{prefixo}", disabled=len(estado["cursores"]) == 1):
+        estado["cursores"].pop()
+        st.rerun()
+    c_pag.caption(f"Página {len(estado['cursores'])}")
+    if c_prox.button("Próxima ➡️", key=f"prox_{prefixo}", disabled=proximo is None):
+        estado["cursores"].append(proximo)
+        st.rerun()
+
+# ==============================
+# BUSCA DE PRODUTOS
+# ==============================
+def escolher_produto(prefixo):
+    """Busca por código/descrição e escolha entre os melhores resultados.
+
+    Fica fora do st.form para que a escolha já preencha descrição, unidade
+    e preço do formulário. Devolve o código escolhido ou "".
+    """
+    c_busca, c_produto = st.columns([1, 2])
+    termo = c_busca.text_input("🔎 Buscar produto", key=f"busca_{prefixo}",
+                               placeholder="código ou descrição")
+    resultados = buscar_produtos(termo)
+    descricoes = dict(zip(resultados["codigo"], resultados["descricao"]))
+    return c_produto.selectbox(
+        "Código", options=[""] + list(descricoes), key=f"produto_{prefixo}",
+        format_func=lambda cod: f"{cod} — {descricoes[cod]}" if cod else ""
+    )
+
+# ==============================
+# PEDIDOS COM VÁRIOS ITENS
+# ==============================
+def mostrar_pedido(tabela, prefixo, rotulo_pessoa, rotulo_preco):
+    """Carrinho com vários itens, gravados juntos por inserir_pedido"""
+    # Itens guardados na sessão; o número no key do editor muda quando o
+    # carrinho é regravado (item adicionado ou pedido gravado)
+    carrinho = st.session_state.setdefault(f"ped_carrinho_{prefixo}", {
+        "itens": pd.DataFrame({
+            "codigo": pd.Series(dtype=object),
+            "descricao": pd.Series(dtype=object),
+            "quantidade": pd.Series(dtype=float),
+            "preco_unitario": pd.Series(dtype=float)
+        }),
+        "versao": 0
+    })
+
+    with st.expander("🛒 Novo pedido (vários itens)", expanded=False):
+        c1, c2, c3 = st.columns(3)
+        data = c1.date_input("Data", value=datetime.now(), format="DD/MM/YYYY", key=f"ped_data_{prefixo}")
+        pessoa = c2.text_input(rotulo_pessoa, key=f"ped_pessoa_{prefixo}")
+        forma_pag = c3.selectbox("Forma Pagamento", options=FORMAS_PAGAMENTO, key=f"ped_pag_{prefixo}")
+        c4, c5 = st.columns([1, 2])
+        nf = c4.text_input("Nota Fiscal (vazio = SEM NOTA)", key=f"ped_nf_{prefixo}")
+        obs = c5.text_input("Observações", key=f"ped_obs_{prefixo}")
+
+        # Produtos entram pela mesma busca indexada dos formulários
+        cod = escolher_produto(f"ped_{prefixo}")
+        area_adicionar = st.container()
+        catalogo = produtos_por_codigo()
+
+        itens = st.data_editor(
+            carrinho["itens"],
+            num_rows="dynamic", use_container_width=True, hide_index=True,
+            key=f"ped_itens_{prefixo}_{carrinho['versao']}",
+            disabled=["codigo", "descricao"],
+            column_config={
+                "codigo": st.column_config.TextColumn("Produto"),
+                "descricao": st.column_config.TextColumn("Descrição"),
+                "quantidade": st.column_config.NumberColumn("Quantidade", min_value=0.01, step=0.01),
+                "preco_unitario": st.column_config.NumberColumn(
+                    rotulo_preco, min_value=0.0, step=0.01, format="R$ %.2f"),
+            }
+        )
+
+        if area_adicionar.button("➕ Adicionar ao pedido", key=f"ped_adicionar_{prefixo}",
+                                 disabled=cod not in catalogo):
+            prod = catalogo[cod]
+            novo = pd.DataFrame([{
+                "codigo": cod, "descricao": prod["descricao"], "quantidade": 1.0,
+                "preco_unitario": prod["preco_sugerido"] if tabela == "saidas" else None
+            }])
+            carrinho["itens"] = pd.concat([itens, novo], ignore_index=True)
+            carrinho["versao"] += 1
+            st.rerun()
+
+        itens = itens.dropna(subset=["codigo", "quantidade"])
+        if tabela == "saidas":
+            # Preço em branco: preço sugerido do cadastro
+            sugerido = itens["codigo"].map(lambda codigo: catalogo.get(codigo, {}).get("preco_sugerido"))
+            itens["preco_unitario"] = itens["preco_unitario"].fillna(sugerido)
+        itens["preco_unitario"] = itens["preco_unitario"].fillna(0.0)
+
+        total = (itens["quantidade"] * itens["preco_unitario"]).sum()
+        st.markdown(f"**{len(itens)} item(ns) | Total: R$ {total:,.2f}**")
+
+        if st.button("💾 Gravar pedido", key=f"ped_salvar_{prefixo}",
+                     disabled=itens.empty, use_container_width=True):
+            try:
+                pedido_id = inserir_pedido(
+                    tabela, data, pessoa, nf.strip() or "SEM NOTA", forma_pag, obs,
+                    st.session_state.usuario_logado,
+                    list(itens[["codigo", "quantidade", "preco_unitario"]].itertuples(index=False, name=None))
+                )
+            except ValueError as erro:      # inclui EstoqueInsuficiente
+                st.error(f"❌ {erro}")
+            else:
+                carrinho["itens"] = carrinho["itens"].iloc[0:0]
+                carrinho["versao"] += 1
+                st.success(f"✅ Pedido #{pedido_id} registrado!")
+                st.rerun()
+
+# ==============================
+# NAVEGAÇÃO
+# ==============================
+# Ao contrário de st.tabs, que executa todas as abas a cada rerun, só a
+# página escolhida roda (ver o fim do script)
+PAGINAS = {
+    "dashboard": "📊 Dashboard", "entradas": "📦 Entradas", "saidas": "🚚 Saídas",
+    "gastos": "💸 Gastos", "produtos": "📋 Produtos", "estoque": "📦 Estoque",
+    "compras_vendas": "🧾 Compras/Vendas (Notas)", "relatorios": "📈 Relatórios"
+}
+
+pagina_atual = st.radio(
+    "Página", options=list(PAGINAS), format_func=PAGINAS.get,
+    horizontal=True, key="pagina", label_visibility="collapsed"
+)
+st.markdown("---")
 
 # ==================== DASHBOARD ====================
-with tab_dash:
+def pagina_dashboard():
     st.header("📊 Dashboard Executivo")
 
-    def filtrar_periodo(df, col_data):
-        if df.empty:
-            return df
-        df2 = df.copy()
-        df2[col_data] = pd.to_datetime(df2[col_data]).dt.date
-        return df2[(df2[col_data] >= data_inicial) & (df2[col_data] <= data_final)]
+    df_estoque = calcular_estoque_atual()
 
-    ent_periodo = filtrar_periodo(df_entradas, "data")
-    sai_periodo = filtrar_periodo(df_saidas, "data")
-    gas_periodo = filtrar_periodo(df_gastos, "data")
-
-    total_vendas = sai_periodo["total_venda"].sum() if not sai_periodo.empty else 0
-    total_compras = ent_periodo["custo_total"].sum() if not ent_periodo.empty else 0
-    total_despesas = gas_periodo["valor"].sum() if not gas_periodo.empty else 0
+    total_vendas = total_periodo("saidas")
+    total_compras = total_periodo("entradas")
+    total_despesas = total_periodo("gastos")
     lucro_bruto = total_vendas - total_compras
     lucro_liquido = lucro_bruto - total_despesas
     valor_estoque = df_estoque["valor_estoque"].sum()
@@ -546,34 +435,68 @@ with tab_dash:
             "Tipo": ["Vendas", "Compras", "Despesas", "Lucro Líquido"],
             "Valor": [total_vendas, total_compras, total_despesas, lucro_liquido]
         })
-        fig_fin = px.bar(df_fin, x="Tipo", y="Valor", color="Tipo", text="Valor")
-        fig_fin.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
-        fig_fin.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig_fin, use_container_width=True)
+        with medir("grafico.financeiro"):
+            fig_fin = px.bar(df_fin, x="Tipo", y="Valor", color="Tipo", text="Valor")
+            fig_fin.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
+            fig_fin.update_layout(height=400, showlegend=False)
+            st.plotly_chart(fig_fin, use_container_width=True)
 
     with col_g2:
         st.subheader("📦 Valor em Estoque")
         df_e = df_estoque[df_estoque["estoque_atual"] > 0]
         if not df_e.empty:
-            fig_est = px.bar(df_e, x="descricao", y="valor_estoque", text="valor_estoque")
-            fig_est.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
-            fig_est.update_layout(height=400, showlegend=False, xaxis_tickangle=45)
-            st.plotly_chart(fig_est, use_container_width=True)
+            with medir("grafico.valor_estoque"):
+                fig_est = px.bar(df_e, x="descricao", y="valor_estoque", text="valor_estoque")
+                fig_est.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
+                fig_est.update_layout(height=400, showlegend=False, xaxis_tickangle=45)
+                st.plotly_chart(fig_est, use_container_width=True)
+
+    st.markdown("---")
+
+    # Evolução no período (agregada em SQL; a figura fica em cache por período e versão)
+    col_t, col_g = st.columns([3, 1])
+    col_t.subheader("📈 Evolução no Período")
+    opcoes = {"auto": "Automático", **{k: v[0] for k, v in GRANULARIDADES.items()}}
+    granularidade = col_g.selectbox("Agrupar por", options=list(opcoes), format_func=opcoes.get)
+    if granularidade == "auto":
+        granularidade = escolher_granularidade(data_inicial, data_final)
+
+    def gerar_figura():
+        serie = carregar_serie_temporal(data_inicial, data_final, granularidade)
+        if serie.empty:
+            return None
+        fig = px.line(
+            serie.rename(columns={"vendas": "Vendas", "compras": "Compras", "gastos": "Despesas"}),
+            x="periodo", y=["Vendas", "Compras", "Despesas"], markers=len(serie) <= 60
+        )
+        fig.update_layout(height=400, xaxis_title="", yaxis_title="R$", legend_title="",
+                          hovermode="x unified")
+        fig.update_yaxes(tickprefix="R$ ")
+        return fig
+
+    with medir("grafico.evolucao", granularidade=granularidade):
+        fig_serie = em_cache(("grafico_serie", data_inicial, data_final, granularidade),
+                             ("entradas", "saidas", "gastos", "resumos"), gerar_figura)
+        if fig_serie is None:
+            st.info("Sem movimentações no período.")
+        else:
+            st.plotly_chart(fig_serie, use_container_width=True)
 
 # ==================== ENTRADAS ====================
-with tab_ent:
+def pagina_entradas():
     st.header("📦 Entradas de Mercadorias")
 
     with st.expander("➕ Nova Entrada", expanded=False):
+        cod = escolher_produto("ent")
+        prod = produtos_por_codigo().get(cod)
+
         with st.form("form_entrada"):
             c1, c2, c3 = st.columns(3)
 
             with c1:
                 data = st.date_input("Data", value=datetime.now(), format="DD/MM/YYYY")
-                cod = st.selectbox("Código", options=[""] + df_produtos["codigo"].tolist())
 
-                if cod:
-                    prod = df_produtos[df_produtos["codigo"] == cod].iloc[0]
+                if prod:
                     desc_default = prod["descricao"]
                     un_default = prod["unidade"]
                 else:
@@ -599,7 +522,7 @@ with tab_ent:
                 obs = st.text_area("Observações", height=60)
 
             if st.form_submit_button("💾 Salvar", use_container_width=True):
-                if not cod:
+                if not prod:
                     st.error("Selecione um produto!")
                 else:
                     custo_total = qtd * custo_unit
@@ -609,42 +532,36 @@ with tab_ent:
                     st.success("✅ Entrada registrada!")
                     st.rerun()
 
-    st.subheader("📋 Histórico de Entradas")
+    mostrar_pedido("entradas", "ent", "Fornecedor", "Custo Unitário")
 
-    if not df_entradas.empty:
-        for _, row in df_entradas.head(20).iterrows():
-            col_data, col_delete = st.columns([10, 1])
-            with col_data:
-                nota_info = f"NF: {row['nota_fiscal']}" if row['nota_fiscal'] else "SEM NOTA"
-                st.write(f"**ID {row['id']}** - {row['data']} - {row['descricao_produto']} - R$ {row['custo_total']:.2f} - {nota_info}")
-            with col_delete:
-                if st.button("🗑️", key=f"del_ent_{row['id']}"):
-                    excluir_entrada(row['id'])
-                    st.success("Excluído!")
-                    st.rerun()
+    st.subheader("📋 Histórico de Entradas")
 
-        st.dataframe(df_entradas, use_container_width=True, height=300)
-    else:
-        st.info("Nenhuma entrada registrada.")
+    mostrar_historico(
+        "entradas", "ent", "Fornecedor",
+        lambda row: f"**ID {row['id']}** - {row['data']} - {row['descricao_produto']} - R$ {row['custo_total']:.2f} - "
+                    + (f"NF: {row['nota_fiscal']}" if row['com_nota'] else "SEM NOTA"),
+        excluir_entrada, "Nenhuma entrada registrada."
+    )
 
 # ==================== SAÍDAS ====================
-with tab_sai:
+def pagina_saidas():
     st.header("🚚 Saídas de Mercadorias")
 
     with st.expander("➕ Nova Saída", expanded=False):
+        cod = escolher_produto("sai")
+        prod = produtos_por_codigo().get(cod)
+
         with st.form("form_saida"):
             c1, c2, c3 = st.columns(3)
 
             with c1:
                 data = st.date_input("Data", value=datetime.now(), format="DD/MM/YYYY")
-                cod = st.selectbox("Código", options=[""] + df_produtos["codigo"].tolist())
 
-                if cod:
-                    prod = df_produtos[df_produtos["codigo"] == cod].iloc[0]
+                if prod:
                     desc_default = prod["descricao"]
                     un_default = prod["unidade"]
                     preco_sug = prod["preco_sugerido"]
-                    est_disp = df_estoque[df_estoque["codigo"] == cod]["estoque_atual"].iloc[0]
+                    est_disp = consultar_estoque(cod)
                 else:
                     desc_default = ""
                     un_default = UNIDADES[0]
@@ -671,38 +588,36 @@ with tab_sai:
                 obs = st.text_area("Observações", height=60)
 
             if st.form_submit_button("💾 Salvar", use_container_width=True):
-                if not cod:
+                if not prod:
                     st.error("Selecione um produto!")
                 elif qtd > est_disp:
                     st.error(f"Estoque insuficiente! Disponível: {est_disp:.2f}")
                 else:
                     total = qtd * preco_unit
-                    inserir_saida(data, cod, desc, unidade, qtd, cliente,
-                                preco_unit, total, nf, forma_pag, obs,
-                                st.session_state.usuario_logado)
-                    st.success("✅ Venda registrada!")
-                    st.rerun()
+                    try:
+                        # O saldo é conferido de novo, e baixado, na transação da venda
+                        inserir_saida(data, cod, desc, unidade, qtd, cliente,
+                                    preco_unit, total, nf, forma_pag, obs,
+                                    st.session_state.usuario_logado)
+                    except EstoqueInsuficiente as erro:
+                        st.error(f"❌ {erro}")
+                    else:
+                        st.success("✅ Venda registrada!")
+                        st.rerun()
+
+    mostrar_pedido("saidas", "sai", "Cliente", "Preço Unitário")
 
     st.subheader("📋 Histórico de Vendas")
 
-    if not df_saidas.empty:
-        for _, row in df_saidas.head(20).iterrows():
-            col_data, col_delete = st.columns([10, 1])
-            with col_data:
-                nota_info = f"NF: {row['nota_fiscal']}" if 'nota_fiscal' in row and row['nota_fiscal'] else "SEM NOTA"
-                st.write(f"**ID {row['id']}** - {row['data']} - {row['cliente']} - R$ {row['total_venda']:.2f} - {nota_info}")
-            with col_delete:
-                if st.button("🗑️", key=f"del_sai_{row['id']}"):
-                    excluir_saida(row['id'])
-                    st.success("Excluído!")
-                    st.rerun()
-
-        st.dataframe(df_saidas, use_container_width=True, height=300)
-    else:
-        st.info("Nenhuma venda registrada.")
+    mostrar_historico(
+        "saidas", "sai", "Cliente",
+        lambda row: f"**ID {row['id']}** - {row['data']} - {row['cliente']} - R$ {row['total_venda']:.2f} - "
+                    + (f"NF: {row['nota_fiscal']}" if row['com_nota'] else "SEM NOTA"),
+        excluir_saida, "Nenhuma venda registrada."
+    )
 
 # ==================== GASTOS ====================
-with tab_gas:
+def pagina_gastos():
     st.header("💸 Gastos Operacionais")
 
     with st.expander("➕ Novo Gasto", expanded=False):
@@ -726,25 +641,27 @@ with tab_gas:
                 st.success("✅ Gasto registrado!")
                 st.rerun()
 
-    st.subheader("📋 Histórico de Gastos")
+    st.subheader("📊 Gastos por Categoria no Período")
+    por_categoria = carregar_resumo_categorias(data_inicial, data_final)
+    if not por_categoria.empty:
+        with medir("grafico.gastos_categoria"):
+            fig_cat = px.bar(por_categoria, x="categoria", y="valor", text="valor", hover_data=["registros"])
+            fig_cat.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
+            fig_cat.update_layout(height=400, showlegend=False, xaxis_tickangle=45)
+            st.plotly_chart(fig_cat, use_container_width=True)
+    else:
+        st.info("Sem gastos no período.")
 
-    if not df_gastos.empty:
-        for _, row in df_gastos.head(20).iterrows():
-            col_data, col_delete = st.columns([10, 1])
-            with col_data:
-                st.write(f"**ID {row['id']}** - {row['data']} - {row['categoria']} - R$ {row['valor']:.2f}")
-            with col_delete:
-                if st.button("🗑️", key=f"del_gas_{row['id']}"):
-                    excluir_gasto(row['id'])
-                    st.success("Excluído!")
-                    st.rerun()
+    st.subheader("📋 Histórico de Gastos")
 
-        st.dataframe(df_gastos, use_container_width=True, height=300)
-    else:
-        st.info("Nenhum gasto registrado.")
+    mostrar_historico(
+        "gastos", "gas", "Fornecedor/Beneficiário",
+        lambda row: f"**ID {row['id']}** - {row['data']} - {row['categoria']} - R$ {row['valor']:.2f}",
+        excluir_gasto, "Nenhum gasto registrado."
+    )
 
 # ==================== PRODUTOS ====================
-with tab_prod:
+def pagina_produtos():
     st.header("📋 Cadastro de Produtos")
 
     with st.expander("➕ Novo Produto", expanded=False):
@@ -775,76 +692,112 @@ with tab_prod:
 
     st.subheader("📦 Produtos Cadastrados")
 
-    if not df_produtos.empty:
-        for _, row in df_produtos.iterrows():
-            col_data, col_delete = st.columns([10, 1])
-            with col_data:
-                st.write(f"**{row['codigo']}** - {row['descricao']} - {row['unidade']} - R$ {row['preco_sugerido']:.2f}")
-            with col_delete:
-                if st.button("🗑️", key=f"del_prod_{row['codigo']}"):
-                    excluir_produto(row['codigo'])
-                    st.success("Produto excluído!")
-                    st.rerun()
+    termo = st.text_input("🔎 Filtrar por código ou descrição", key="cat_filtro").strip()
+
+    # Pilha de cursores (último código de cada página); volta ao início se o filtro mudar
+    estado = st.session_state.setdefault("cat_paginas", {"filtro": termo, "cursores": [None], "versao": 0})
+    if estado["filtro"] != termo:
+        estado.update(filtro=termo, cursores=[None])
+
+    pagina, proximo = carregar_pagina_produtos(TAMANHO_PAGINA_CATALOGO, estado["cursores"][-1], termo)
+
+    if not pagina.empty:
+        # Um único editor por página no lugar de uma linha + botão por produto
+        original = pagina[["codigo", "descricao", "unidade", "preco_sugerido", "estoque_minimo"]]
+        editado = st.data_editor(
+            original.assign(excluir=False),
+            key=f"cat_editor_{estado['versao']}_{len(estado['cursores'])}",
+            use_container_width=True, hide_index=True,
+            disabled=["codigo", "descricao", "unidade"],
+            column_config={
+                "preco_sugerido": st.column_config.NumberColumn("Preço Sugerido", min_value=0.0, format="R$ %.2f", required=True),
+                "estoque_minimo": st.column_config.NumberColumn("Estoque Mínimo", min_value=0.0, required=True),
+                "excluir": st.column_config.CheckboxColumn("Excluir"),
+            }
+        )
 
-        st.dataframe(df_produtos, use_container_width=True, height=300)
+        mudou = (editado["preco_sugerido"] != original["preco_sugerido"]) | \
+                (editado["estoque_minimo"] != original["estoque_minimo"])
+        marcados = editado.loc[editado["excluir"], "codigo"].tolist()
+
+        c_salvar, c_excluir = st.columns(2)
+        if c_salvar.button(f"💾 Salvar alterações ({int(mudou.sum())})", disabled=not mudou.any(),
+                           use_container_width=True):
+            alteracoes = editado.loc[mudou, ["codigo", "preco_sugerido", "estoque_minimo"]]
+            try:
+                atualizar_produtos(list(alteracoes.itertuples(index=False, name=None)))
+            except ValueError as erro:
+                st.error(f"❌ {erro}")
+            else:
+                estado["versao"] += 1
+                st.success("✅ Produtos atualizados!")
+                st.rerun()
+        if c_excluir.button(f"🗑️ Excluir selecionados ({len(marcados)})", disabled=not marcados,
+                            use_container_width=True):
+            excluir_produtos(marcados)
+            estado["versao"] += 1
+            st.success("Produtos excluídos!")
+            st.rerun()
     else:
-        st.info("Nenhum produto cadastrado.")
+        st.info("Nenhum produto cadastrado." if not termo else "Nenhum produto encontrado.")
+
+    c_ant, c_pag, c_prox = st.columns([1, 4, 1])
+    if c_ant.button("⬅️ Anterior", key="cat_ant", disabled=len(estado["cursores"]) == 1):
+        estado["cursores"].pop()
+        st.rerun()
+    c_pag.caption(f"Página {len(estado['cursores'])}")
+    if c_prox.button("Próxima ➡️", key="cat_prox", disabled=proximo is None):
+        estado["cursores"].append(proximo)
+        st.rerun()
+
+    with st.expander("💲 Reajuste de preços em lote", expanded=False):
+        alvo = f'produtos que casam com "{termo}"' if termo else "todos os produtos"
+        with st.form("form_reajuste"):
+            percentual = st.number_input("Reajuste (%)", min_value=-99.99, value=0.0, step=0.5, format="%.2f")
+            st.caption(f"Aplica a {alvo} (use o filtro acima para escolher).")
+            if st.form_submit_button("Aplicar", use_container_width=True) and percentual:
+                alterados = reajustar_precos(percentual, termo)
+                estado["versao"] += 1
+                st.success(f"✅ {alterados} produto(s) reajustado(s) em {percentual:+.2f}%")
+                st.rerun()
 
 # ==================== ESTOQUE ====================
-with tab_est:
+def pagina_estoque():
     st.header("📦 Estoque Atual")
 
-    if not df_estoque.empty:
-        st.dataframe(df_estoque, use_container_width=True, height=400)
-        st.markdown(f"### 💰 Valor Total: **R$ {df_estoque['valor_estoque'].sum():,.2f}**")
+    col_met, col_data = st.columns([3, 1])
+    metodo = col_met.radio(
+        "Método de custeio", options=list(METODOS_CUSTEIO),
+        format_func=METODOS_CUSTEIO.get, horizontal=True
+    )
+    hoje = datetime.now().date()
+    posicao = col_data.date_input("Posição em", value=hoje, max_value=hoje, format="DD/MM/YYYY")
+
+    if posicao >= hoje:
+        df_estoque_val = calcular_estoque_atual(metodo)
+    else:
+        # Fotografia mensal + movimentações do mês até a data
+        st.caption(f"Estoque no fim do dia {posicao:%d/%m/%Y}")
+        df_estoque_val = calcular_estoque_em(posicao, metodo)
+
+    if not df_estoque_val.empty:
+        st.dataframe(df_estoque_val, use_container_width=True, height=400)
+        st.markdown(f"### 💰 Valor Total: **R$ {df_estoque_val['valor_estoque'].sum():,.2f}**")
     else:
         st.info("Sem produtos em estoque.")
 
 # ==================== COMPRAS/VENDAS COM E SEM NOTA ====================
-with tab_cmp:
+def pagina_compras_vendas():
     st.header("🧾 Compras e Vendas – Com e Sem Nota Fiscal")
 
-    # Garantir coluna nota_fiscal em entradas
-    df_entradas_aux = df_entradas.copy()
-    if "nota_fiscal" not in df_entradas_aux.columns:
-        df_entradas_aux["nota_fiscal"] = ""
-
-    # Criar flag com/sem nota
-    df_entradas_aux["tem_nota"] = df_entradas_aux["nota_fiscal"].apply(
-        lambda x: "Com nota" if isinstance(x, str) and x.strip() not in ["", "SEM NOTA", "sem nota", "Sem nota"] else "Sem nota"
-    )
-
-    # Garantir coluna nota_fiscal em saídas
-    df_saidas_aux = df_saidas.copy()
-    if "nota_fiscal" not in df_saidas_aux.columns:
-        df_saidas_aux["nota_fiscal"] = ""
-
-    df_saidas_aux["tem_nota"] = df_saidas_aux["nota_fiscal"].apply(
-        lambda x: "Com nota" if isinstance(x, str) and x.strip() not in ["", "SEM NOTA", "sem nota", "Sem nota"] else "Sem nota"
-    )
-
-    # Filtro por período
-    def filtrar_periodo(df, col_data):
-        if df.empty:
-            return df
-        df2 = df.copy()
-        df2[col_data] = pd.to_datetime(df2[col_data]).dt.date
-        return df2[(df2[col_data] >= data_inicial) & (df2[col_data] <= data_final)]
-
-    ent_periodo = filtrar_periodo(df_entradas_aux, "data")
-    sai_periodo = filtrar_periodo(df_saidas_aux, "data")
-
     col_top1, col_top2 = st.columns(2)
 
     # ================= COMPRAS (ENTRADAS) =================
     with col_top1:
         st.subheader("📥 Compras (Entradas)")
 
-        compras_com_nota = ent_periodo[ent_periodo["tem_nota"] == "Com nota"]
-        compras_sem_nota = ent_periodo[ent_periodo["tem_nota"] == "Sem nota"]
-
-        total_com_nota = compras_com_nota["custo_total"].sum() if not compras_com_nota.empty else 0
-        total_sem_nota = compras_sem_nota["custo_total"].sum() if not compras_sem_nota.empty else 0
+        total_com_nota = total_periodo("entradas", com_nota=True)
+        total_sem_nota = total_periodo("entradas", com_nota=False)
 
         c1, c2 = st.columns(2)
         c1.metric("Com nota fiscal", f"R$ {total_com_nota:,.2f}")
@@ -854,20 +807,18 @@ with tab_cmp:
             "Tipo": ["Com nota", "Sem nota"],
             "Valor": [total_com_nota, total_sem_nota]
         })
-        fig_comp = px.bar(df_comp, x="Tipo", y="Valor", text="Valor", color="Tipo", color_discrete_sequence=["#3498db", "#e67e22"])
-        fig_comp.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
-        fig_comp.update_layout(height=350, showlegend=False)
-        st.plotly_chart(fig_comp, use_container_width=True)
+        with medir("grafico.compras_nota"):
+            fig_comp = px.bar(df_comp, x="Tipo", y="Valor", text="Valor", color="Tipo", color_discrete_sequence=["#3498db", "#e67e22"])
+            fig_comp.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
+            fig_comp.update_layout(height=350, showlegend=False)
+            st.plotly_chart(fig_comp, use_container_width=True)
 
     # ================= VENDAS (SAÍDAS) =================
     with col_top2:
         st.subheader("🚚 Vendas (Saídas)")
 
-        vendas_com_nota = sai_periodo[sai_periodo["tem_nota"] == "Com nota"]
-        vendas_sem_nota = sai_periodo[sai_periodo["tem_nota"] == "Sem nota"]
-
-        total_vendas_com_nota = vendas_com_nota["total_venda"].sum() if not vendas_com_nota.empty else 0
-        total_vendas_sem_nota = vendas_sem_nota["total_venda"].sum() if not vendas_sem_nota.empty else 0
+        total_vendas_com_nota = total_periodo("saidas", com_nota=True)
+        total_vendas_sem_nota = total_periodo("saidas", com_nota=False)
 
         c1, c2 = st.columns(2)
         c1.metric("Com nota fiscal", f"R$ {total_vendas_com_nota:,.2f}")
@@ -877,10 +828,11 @@ with tab_cmp:
             "Tipo": ["Com nota", "Sem nota"],
             "Valor": [total_vendas_com_nota, total_vendas_sem_nota]
         })
-        fig_vend = px.bar(df_vend, x="Tipo", y="Valor", text="Valor", color="Tipo", color_discrete_sequence=["#27ae60", "#e74c3c"])
-        fig_vend.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
-        fig_vend.update_layout(height=350, showlegend=False)
-        st.plotly_chart(fig_vend, use_container_width=True)
+        with medir("grafico.vendas_nota"):
+            fig_vend = px.bar(df_vend, x="Tipo", y="Valor", text="Valor", color="Tipo", color_discrete_sequence=["#27ae60", "#e74c3c"])
+            fig_vend.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
+            fig_vend.update_layout(height=350, showlegend=False)
+            st.plotly_chart(fig_vend, use_container_width=True)
 
     st.markdown("---")
 
@@ -888,33 +840,97 @@ with tab_cmp:
     st.subheader("📦 Estoque ligado a Compras com/sem Nota")
 
     # Quantidade total comprada com e sem nota por produto
-    if not ent_periodo.empty:
-        comp_por_prod = ent_periodo.groupby(["codigo_produto", "descricao_produto", "unidade", "tem_nota"]).agg({
-            "quantidade": "sum",
-            "custo_total": "sum"
-        }).reset_index()
-        comp_por_prod = comp_por_prod.rename(columns={"quantidade": "qtd_comprada", "custo_total": "valor_comprado"})
+    comp_por_prod = carregar_resumo_produtos("entradas", data_inicial, data_final)
+    if not comp_por_prod.empty:
+        comp_por_prod = comp_por_prod.rename(columns={"quantidade": "qtd_comprada", "valor": "valor_comprado"})
 
         st.dataframe(comp_por_prod, use_container_width=True)
     else:
         st.info("Sem compras no período para analisar com/sem nota.")
 
 # ==================== RELATÓRIOS ====================
-with tab_rel:
+def pagina_relatorios():
     st.header("📈 Relatórios e Análises")
 
-    st.subheader("🏆 Top Produtos por Faturamento")
+    st.subheader("🏆 Top Produtos")
+    st.caption(f"Período: {data_inicial.strftime('%d/%m/%Y')} a {data_final.strftime('%d/%m/%Y')}")
+
+    c1, c2 = st.columns([3, 1])
+    criterio = c1.radio("Ordenar por", options=list(CRITERIOS_RANKING),
+                        format_func=CRITERIOS_RANKING.get, horizontal=True)
+    limite = c2.number_input("Quantos", min_value=5, max_value=50, value=10, step=5)
+
+    top = carregar_ranking_produtos(data_inicial, data_final, criterio=criterio, limite=limite)
+    if top.empty:
+        st.info("Sem vendas no período para análise.")
+        return
+
+    texto = "%{y:,.2f}" if criterio == "quantidade" else "R$ %{y:,.2f}"
+    with medir("grafico.top_produtos"):
+        fig_top = px.bar(top, x="descricao_produto", y=criterio, text=criterio,
+                         hover_data=["codigo_produto", "quantidade", "receita", "margem"])
+        fig_top.update_traces(texttemplate=texto, textposition="outside")
+        fig_top.update_layout(height=450, showlegend=False, xaxis_tickangle=45,
+                              xaxis_title="", yaxis_title=CRITERIOS_RANKING[criterio])
+        st.plotly_chart(fig_top, use_container_width=True)
 
-    if not df_saidas.empty:
-        top = df_saidas.groupby("descricao_produto")["total_venda"].sum().reset_index()
-        top = top.sort_values("total_venda", ascending=False).head(10)
+    st.dataframe(
+        top, use_container_width=True, hide_index=True,
+        column_config={"margem_pct": st.column_config.NumberColumn("margem %", format="percent")}
+    )
 
-        fig_top = px.bar(top, x="descricao_produto", y="total_venda", text="total_venda")
-        fig_top.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
-        fig_top.update_layout(height=450, showlegend=False, xaxis_tickangle=45)
-        st.plotly_chart(fig_top, use_container_width=True)
-    else:
-        st.info("Sem vendas para análise.")
+    # ================= DETALHE DE UM PRODUTO =================
+    st.markdown("---")
+    st.subheader("🔎 Detalhar produto")
+
+    descricoes = dict(zip(top["codigo_produto"], top["descricao_produto"]))
+    codigo = st.selectbox("Produto", options=list(descricoes),
+                          format_func=lambda c: f"{c} – {descricoes[c]}")
+
+    col_mes, col_cli = st.columns(2)
+
+    with col_mes:
+        st.markdown("**Por mês**")
+        por_mes = carregar_vendas_por_mes(codigo, data_inicial, data_final)
+        with medir("grafico.produto_por_mes"):
+            fig_mes = px.bar(por_mes, x="mes", y="receita", text="receita", hover_data=["quantidade"])
+            fig_mes.update_traces(texttemplate="R$ %{y:,.2f}", textposition="outside")
+            fig_mes.update_layout(height=350, showlegend=False, xaxis_title="", yaxis_title="Faturamento")
+            st.plotly_chart(fig_mes, use_container_width=True)
+
+    with col_cli:
+        st.markdown("**Por cliente**")
+        por_cliente = carregar_vendas_por_cliente(codigo, data_inicial, data_final)
+        st.dataframe(por_cliente, use_container_width=True, hide_index=True, height=350)
+
+# ==============================
+# PÁGINA ATUAL
+# ==============================
+# Somente a página escolhida busca dados e monta gráficos
+FUNCOES_PAGINAS = {
+    "dashboard": pagina_dashboard, "entradas": pagina_entradas, "saidas": pagina_saidas,
+    "gastos": pagina_gastos, "produtos": pagina_produtos, "estoque": pagina_estoque,
+    "compras_vendas": pagina_compras_vendas, "relatorios": pagina_relatorios
+}
+
+try:
+    with medir(f"pagina.{pagina_atual}"):
+        FUNCOES_PAGINAS[pagina_atual]()
+finally:
+    # Uma escrita no log por execução (também quando a página chama st.rerun)
+    gravar_spans()
+
+if st.session_state.usuario_logado == "admin":
+    with painel_perfil:
+        spans = spans_da_execucao()
+        st.write(f"Execução: **{tempo_execucao_ms():,.0f} ms** | Spans: {len(spans)}")
+        if not spans.empty:
+            spans["nome"] = ["· " * nivel + nome for nivel, nome in zip(spans["nivel"], spans["nome"])]
+            st.dataframe(
+                spans.drop(columns=["nivel"]),
+                use_container_width=True, hide_index=True,
+                column_config={"ms": st.column_config.NumberColumn(format="%.1f")}
+            )
 
 st.markdown(f"""
     <div style="text-align: center; color: #7f8c8d; margin-top: 2rem;">
@@ -0,0 +1,1612 @@
+import pandas as pd
+import hashlib
+import sqlite3
+import sys
+import re
+import threading
+from datetime import datetime, timedelta
+
+from cache import CACHE, AUSENTE
+# Conexões e configuração (DATABASE_URL etc. continuam importáveis de banco)
+from conexoes import (
+    BACKEND, DB_FILE, DATABASE_URL, USE_POSTGRES, get_connection, conexao, transacao
+)
+from custeio import valorizar_estoque
+from perfil import medido, medir, anotar
+import resumos
+
+# ==============================
+# CONSTANTES
+# ==============================
+UNIDADES = ["m³", "un", "kg", "saco", "ton", "litro", "caixa", "barra", "hora"]
+FORMAS_PAGAMENTO = ["À vista", "A prazo", "Cartão débito", "Cartão crédito", "PIX", "Boleto", "Cheque"]
+CATEGORIAS_GASTO = [
+    "Peças de carro", "Combustíveis", "Salários de funcionários",
+    "Manutenção caminhões caçamba", "Manutenção retroescavadeiras",
+    "Custos de depósito – Aluguel", "Custos de depósito – Luz/Água",
+    "Custos de depósito – Outros", "Seguros", "Impostos"
+]
+
+# Colunas gravadas por inserir_* / inserir_lote, na ordem do INSERT
+COLUNAS_INSERCAO = {
+    "entradas": ["data", "codigo_produto", "descricao_produto", "unidade", "quantidade",
+                 "fornecedor", "custo_unitario", "custo_total", "nota_fiscal",
+                 "forma_pagamento", "observacoes", "usuario_registro"],
+    "saidas": ["data", "codigo_produto", "descricao_produto", "unidade", "quantidade",
+               "cliente", "preco_unitario", "total_venda", "nota_fiscal",
+               "forma_pagamento", "observacoes", "usuario_registro"],
+    "gastos": ["data", "categoria", "descricao", "fornecedor_beneficiario", "valor",
+               "forma_pagamento", "observacoes", "usuario_registro"],
+    "produtos": ["codigo", "descricao", "unidade", "preco_sugerido",
+                 "estoque_minimo", "estoque_inicial"],
+}
+
+# ==============================
+# MIGRAÇÕES
+# ==============================
+# O schema evolui por passos numerados, aplicados uma única vez e
+# registrados em schema_version. Cada passo é idempotente (IF NOT EXISTS),
+# então um banco criado antes das migrações começa da versão 0 sem perder
+# nada. Para mudar o schema, acrescente um passo no fim de MIGRACOES.
+def _migracao_tabelas_iniciais(cursor):
+    # Tabela de usuários
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario TEXT UNIQUE NOT NULL,
+            senha_hash TEXT NOT NULL,
+            nome_completo TEXT,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Tabela de entradas
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS entradas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data DATE NOT NULL,
+            codigo_produto TEXT NOT NULL,
+            descricao_produto TEXT NOT NULL,
+            unidade TEXT NOT NULL,
+            quantidade REAL NOT NULL,
+            fornecedor TEXT,
+            custo_unitario REAL NOT NULL,
+            custo_total REAL NOT NULL,
+            nota_fiscal TEXT,
+            forma_pagamento TEXT,
+            observacoes TEXT,
+            usuario_registro TEXT,
+            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Tabela de saídas
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS saidas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data DATE NOT NULL,
+            codigo_produto TEXT NOT NULL,
+            descricao_produto TEXT NOT NULL,
+            unidade TEXT NOT NULL,
+            quantidade REAL NOT NULL,
+            cliente TEXT,
+            preco_unitario REAL NOT NULL,
+            total_venda REAL NOT NULL,
+            nota_fiscal TEXT,
+            forma_pagamento TEXT,
+            observacoes TEXT,
+            usuario_registro TEXT,
+            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Bancos antigos: saídas sem a coluna nota_fiscal
+    colunas = [nome for nome, _ in BACKEND.colunas(cursor, "saidas")]
+    if "nota_fiscal" not in colunas:
+        cursor.execute("ALTER TABLE saidas ADD COLUMN nota_fiscal TEXT")
+
+    # Tabela de gastos
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS gastos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data DATE NOT NULL,
+            categoria TEXT NOT NULL,
+            descricao TEXT,
+            fornecedor_beneficiario TEXT,
+            valor REAL NOT NULL,
+            forma_pagamento TEXT,
+            observacoes TEXT,
+            usuario_registro TEXT,
+            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Tabela de produtos
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo TEXT UNIQUE NOT NULL,
+            descricao TEXT NOT NULL,
+            unidade TEXT NOT NULL,
+            preco_sugerido REAL NOT NULL,
+            estoque_minimo REAL NOT NULL,
+            estoque_inicial REAL DEFAULT 0
+        )
+    """)
+
+    # Usuários padrão
+    cursor.execute("SELECT COUNT(*) FROM usuarios")
+    if cursor.fetchone()[0] == 0:
+        usuarios_padrao = [
+            ("admin", hash_password("admin123"), "Administrador"),
+            ("maria", hash_password("maria2024"), "Maria Luiza"),
+            ("vitoria", hash_password("vitoria123"), "Vitória")
+        ]
+        cursor.executemany(
+            "INSERT INTO usuarios (usuario, senha_hash, nome_completo) VALUES (?, ?, ?)",
+            usuarios_padrao
+        )
+
+def _migracao_versoes(cursor):
+    # Versão de cada tabela: incrementada a cada escrita, invalida o cache
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS versoes (
+            tabela TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+def _migracao_estoque(cursor):
+    # Saldo por produto, mantido pelas entradas/saídas; montado a partir
+    # das movimentações já existentes
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS estoque (
+            codigo TEXT PRIMARY KEY,
+            qtd_entradas REAL NOT NULL DEFAULT 0,
+            qtd_saidas REAL NOT NULL DEFAULT 0,
+            estoque_atual REAL NOT NULL DEFAULT 0,
+            custo_total_entradas REAL NOT NULL DEFAULT 0
+        )
+    """)
+    _reconstruir_estoque(cursor, arquivo=False)   # o arquivo mensal só surge na migração 9
+
+def _migracao_resumos(cursor):
+    # Resumos diários (KPIs do Dashboard e Compras/Vendas)
+    resumos.criar_tabelas(cursor)
+    resumos.reconstruir(cursor, arquivo=False)
+
+def _migracao_indices_periodo(cursor):
+    # Índices para filtros por período e por produto
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_entradas_data ON entradas (data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_entradas_produto ON entradas (codigo_produto, data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_saidas_data ON saidas (data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_saidas_produto ON saidas (codigo_produto, data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_gastos_data ON gastos (data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_gastos_categoria ON gastos (categoria, data)")
+
+def _migracao_coluna_com_nota(cursor):
+    # Com/sem nota classificado uma vez, na gravação, em vez de a cada leitura;
+    # as linhas existentes recebem a mesma regra de resumos.tem_nota_fiscal()
+    for tabela in ["entradas", "saidas"]:
+        if "com_nota" not in [nome for nome, _ in BACKEND.colunas(cursor, tabela)]:
+            cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN com_nota INTEGER NOT NULL DEFAULT 0")
+        cursor.execute(f"UPDATE {tabela} SET com_nota = {resumos.SQL_TEM_NOTA}")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_nota ON {tabela} (com_nota, data)")
+
+def _migracao_pedidos(cursor):
+    # Cabeçalho de pedidos com vários itens; os itens ficam em entradas/saídas
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            data DATE NOT NULL,
+            pessoa TEXT,
+            nota_fiscal TEXT,
+            com_nota INTEGER NOT NULL DEFAULT 0,
+            forma_pagamento TEXT,
+            observacoes TEXT,
+            usuario_registro TEXT,
+            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for tabela in ["entradas", "saidas"]:
+        if "pedido_id" not in [nome for nome, _ in BACKEND.colunas(cursor, tabela)]:
+            cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN pedido_id INTEGER REFERENCES pedidos (id)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_pedido ON {tabela} (pedido_id)")
+
+def _migracao_snapshots_estoque(cursor):
+    # Fotografia acumulada do estoque no fim de cada mês (ver calcular_estoque_em)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS estoque_mensal (
+            mes TEXT NOT NULL,
+            codigo TEXT NOT NULL,
+            qtd_entradas REAL NOT NULL DEFAULT 0,
+            qtd_saidas REAL NOT NULL DEFAULT 0,
+            custo_total_entradas REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (mes, codigo)
+        )
+    """)
+    # Meses já fotografados (um mês sem movimento não tem linhas acima)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS snapshots_estoque (
+            mes TEXT PRIMARY KEY,
+            gerado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+# Movimentos de meses fechados podem ir para {tabela}_arquivo (ver
+# arquivar_meses); a visão {tabela}_todas junta as duas partes.
+TABELAS_ARQUIVAVEIS = ["entradas", "saidas", "gastos"]
+
+def _migracao_arquivo_mensal(cursor):
+    # Mesmas colunas da tabela quente, na mesma ordem; os ids vêm dela.
+    # Uma migração futura que acrescente coluna em entradas/saídas/gastos
+    # precisa acrescentá-la aqui também e recriar a visão.
+    for tabela in TABELAS_ARQUIVAVEIS:
+        colunas = BACKEND.colunas(cursor, tabela)
+        definicoes = ", ".join(f"{nome} {tipo}" + (" PRIMARY KEY" if nome == "id" else "")
+                               for nome, tipo in colunas)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {tabela}_arquivo ({definicoes})")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_arquivo_data ON {tabela}_arquivo (data)")
+        if tabela != "gastos":
+            cursor.execute(f"""CREATE INDEX IF NOT EXISTS idx_{tabela}_arquivo_produto
+                               ON {tabela}_arquivo (codigo_produto, data)""")
+        lista = ", ".join(nome for nome, _ in colunas)
+        cursor.execute(f"""
+            CREATE VIEW IF NOT EXISTS {tabela}_todas AS
+            SELECT {lista} FROM {tabela}
+            UNION ALL
+            SELECT {lista} FROM {tabela}_arquivo
+        """)
+    # Uma linha por mês arquivado e tabela, com os totais movidos
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meses_arquivados (
+            mes TEXT NOT NULL,
+            tabela TEXT NOT NULL,
+            registros INTEGER NOT NULL DEFAULT 0,
+            quantidade REAL NOT NULL DEFAULT 0,
+            valor REAL NOT NULL DEFAULT 0,
+            arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (mes, tabela)
+        )
+    """)
+
+def _migracao_busca_produtos(cursor):
+    # Índice de texto (FTS5) sobre código e descrição, mantido por gatilhos;
+    # "cim 50" encontra "CIM-50 Cimento CP-II 50kg" por prefixo de cada termo.
+    # Sem FTS5 (ou no PostgreSQL), buscar_produtos() usa LIKE no código e na descrição.
+    if not BACKEND.fts:
+        return
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS produtos_busca USING fts5(
+                codigo, descricao,
+                content='produtos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS produtos_busca_ai AFTER INSERT ON produtos BEGIN
+            INSERT INTO produtos_busca (rowid, codigo, descricao) VALUES (new.id, new.codigo, new.descricao);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS produtos_busca_ad AFTER DELETE ON produtos BEGIN
+            INSERT INTO produtos_busca (produtos_busca, rowid, codigo, descricao)
+            VALUES ('delete', old.id, old.codigo, old.descricao);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS produtos_busca_au AFTER UPDATE OF codigo, descricao ON produtos BEGIN
+            INSERT INTO produtos_busca (produtos_busca, rowid, codigo, descricao)
+            VALUES ('delete', old.id, old.codigo, old.descricao);
+            INSERT INTO produtos_busca (rowid, codigo, descricao) VALUES (new.id, new.codigo, new.descricao);
+        END
+    """)
+    cursor.execute("INSERT INTO produtos_busca (produtos_busca) VALUES ('rebuild')")
+
+# (versão, descrição, função) em ordem; nunca altere um passo já publicado
+MIGRACOES = [
+    (1, "tabelas iniciais e usuários padrão", _migracao_tabelas_iniciais),
+    (2, "versões das tabelas (cache)", _migracao_versoes),
+    (3, "tabela de estoque", _migracao_estoque),
+    (4, "resumos diários", _migracao_resumos),
+    (5, "índices por data e produto", _migracao_indices_periodo),
+    (6, "coluna com_nota em entradas e saídas", _migracao_coluna_com_nota),
+    (7, "pedidos com vários itens", _migracao_pedidos),
+    (8, "fotografias mensais do estoque", _migracao_snapshots_estoque),
+    (9, "arquivo mensal de movimentos", _migracao_arquivo_mensal),
+    (10, "busca de produtos (FTS5)", _migracao_busca_produtos),
+]
+
+def versao_schema(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+def migrar():
+    """Aplica as migrações pendentes; devolve as versões aplicadas"""
+    aplicadas = []
+    # Uma transação de escrita por vez (BEGIN IMMEDIATE, ou a trava no
+    # PostgreSQL): outro processo que tente migrar ao mesmo tempo espera e
+    # depois encontra a versão atualizada
+    with transacao() as cursor:
+        atual = versao_schema(cursor)
+        for versao, descricao, aplicar in MIGRACOES:
+            if versao <= atual:
+                continue
+            aplicar(cursor)
+            cursor.execute("INSERT INTO schema_version (versao, descricao) VALUES (?, ?)",
+                           (versao, descricao))
+            aplicadas.append(versao)
+        _detectar_busca_fts(cursor)
+        _carregar_colunas_movimentos(cursor)
+    return aplicadas
+
+_banco_pronto = False
+_banco_lock = threading.Lock()
+
+def init_database():
+    """Migra o banco uma vez por processo; nas demais chamadas não faz nada"""
+    global _banco_pronto
+    if _banco_pronto:
+        return
+    with _banco_lock:
+        if not _banco_pronto:
+            migrar()
+            _banco_pronto = True
+
+def hash_password(password):
+    """Cria hash da senha"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def verificar_login(usuario, senha):
+    """Verifica login no banco de dados"""
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT senha_hash, nome_completo FROM usuarios WHERE usuario = ?",
+            (usuario,)
+        )
+        result = cursor.fetchone()
+
+    if result and result[0] == hash_password(senha):
+        return True, result[1]
+    return False, None
+
+# ==============================
+# VERSÕES DAS TABELAS / CACHE
+# ==============================
+def _incrementar_versao(cursor, *tabelas):
+    """Marca as tabelas como alteradas (na transação da escrita)"""
+    cursor.executemany("""
+        INSERT INTO versoes (tabela, versao) VALUES (?, 1)
+        ON CONFLICT (tabela) DO UPDATE SET versao = versoes.versao + 1
+    """, [(tabela,) for tabela in tabelas])
+
+def _ler_versoes(cursor, tabelas):
+    marcadores = ", ".join("?" for _ in tabelas)
+    cursor.execute(f"SELECT tabela, versao FROM versoes WHERE tabela IN ({marcadores})", tabelas)
+    versoes = dict(cursor.fetchall())
+    return tuple(versoes.get(tabela, 0) for tabela in tabelas)
+
+def versoes_tabelas(tabelas):
+    """Versão atual de cada tabela (muda a cada escrita)"""
+    with conexao() as conn:
+        return _ler_versoes(conn.cursor(), tuple(tabelas))
+
+def _consultar_em_cache(chave, tabelas, carregar):
+    """Devolve o resultado em cache enquanto as tabelas não mudarem.
+
+    carregar(conn) só é chamado quando alguma versão mudou desde a última leitura.
+    """
+    with conexao() as conn:
+        versoes = _ler_versoes(conn.cursor(), tabelas)
+        df = CACHE.obter(chave, versoes)
+        anotar(cache="miss" if df is AUSENTE else "hit")
+        if df is AUSENTE:
+            with medir("leitura_sem_cache"):
+                df = carregar(conn)
+            CACHE.guardar(chave, versoes, df)
+        return df
+
+def ler_sql(conn, sql, params=(), parse_dates=None):
+    """DataFrame do SELECT, pelo cursor da conexão (SQLite ou PostgreSQL)"""
+    cursor = conn.execute(sql, params)
+    df = pd.DataFrame.from_records(cursor.fetchall(), columns=[col[0] for col in cursor.description],
+                                   coerce_float=True)
+    for coluna in parse_dates or []:
+        df[coluna] = pd.to_datetime(df[coluna])
+    return df
+
+def _ler_tabela(sql, tabela, params=()):
+    return _consultar_em_cache((sql, params), (tabela,),
+                               lambda conn: ler_sql(conn, sql, params))
+
+def _filtro_periodo(data_inicial, data_final, coluna="data"):
+    """Cláusula WHERE por data (usa os índices idx_*_data)"""
+    condicoes, params = [], []
+    if data_inicial is not None:
+        condicoes.append(f"{coluna} >= ?")
+        params.append(str(data_inicial))
+    if data_final is not None:
+        # Dia final inteiro, mesmo se a data foi gravada com hora
+        condicoes.append(f"{coluna} < ?")
+        params.append(str(data_final + timedelta(days=1)))
+    where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return where, tuple(params)
+
+def _ler_inicio_quente(conn):
+    cursor = conn.execute("SELECT MAX(mes) FROM meses_arquivados")
+    mes = cursor.fetchone()[0]
+    return "" if mes is None else f"{_mes_seguinte(mes)}-01"
+
+def _inicio_quente():
+    """Primeiro dia depois do último mês arquivado ("" se nada foi arquivado).
+
+    Em cache pela versão "arquivo", que só arquivar_meses() incrementa.
+    """
+    return _consultar_em_cache(("inicio_quente",), ("arquivo",), _ler_inicio_quente)
+
+def fonte_movimentos(tabela, data_inicial=None):
+    """Tabela a consultar para um período que começa em data_inicial.
+
+    Períodos que começam depois do último mês arquivado leem só a tabela
+    quente; os demais, a visão {tabela}_todas (quente + arquivo).
+    """
+    inicio = _inicio_quente()
+    if not inicio or (data_inicial is not None and str(data_inicial) >= inicio):
+        return tabela
+    return f"{tabela}_todas"
+
+def sql_movimentos(tabela, data_inicial=None, data_final=None, colunas=None):
+    """SELECT da tabela de movimentos, opcionalmente limitado ao período e às colunas"""
+    where, params = _filtro_periodo(data_inicial, data_final)
+    selecao = ", ".join(colunas) if colunas else "*"
+    fonte = fonte_movimentos(tabela, data_inicial)
+    return f"SELECT {selecao} FROM {fonte}{where} ORDER BY data DESC", params
+
+# Tipos dos DataFrames de movimentos: textos repetitivos viram categorias
+# (um código por linha em vez de uma string) e as datas já chegam como
+# datetime64, sem cada aba reconverter. Colunas fora daqui ficam como o
+# pandas as lê (números em int64/float64, textos livres em object).
+CATEGORIAS_MOVIMENTOS = {
+    "entradas": ["codigo_produto", "unidade", "fornecedor", "forma_pagamento", "usuario_registro"],
+    "saidas": ["codigo_produto", "unidade", "cliente", "forma_pagamento", "usuario_registro"],
+    "gastos": ["categoria", "fornecedor_beneficiario", "forma_pagamento", "usuario_registro"],
+}
+DATAS_MOVIMENTOS = ["data", "data_registro"]
+
+def _tipar_movimentos(df, tabela):
+    """Aplica o schema de CATEGORIAS_MOVIMENTOS/DATAS_MOVIMENTOS às colunas presentes"""
+    for coluna in DATAS_MOVIMENTOS:
+        if coluna in df:
+            # Datas gravadas com ou sem hora
+            df[coluna] = pd.to_datetime(df[coluna], format="ISO8601", errors="coerce")
+    for coluna in CATEGORIAS_MOVIMENTOS[tabela]:
+        if coluna in df:
+            df[coluna] = df[coluna].astype("category")
+    if "com_nota" in df:
+        df["com_nota"] = df["com_nota"].astype("int8")
+    return df
+
+# Colunas de cada tabela de movimento, lidas uma vez por processo (em
+# migrar(), ou na primeira projeção) para validar `colunas` sem consultar
+# o schema a cada carga
+_colunas_movimentos = {}
+
+def _carregar_colunas_movimentos(cursor):
+    for tabela in CATEGORIAS_MOVIMENTOS:
+        _colunas_movimentos[tabela] = frozenset(nome for nome, _ in BACKEND.colunas(cursor, tabela))
+
+def _colunas_movimento(tabela):
+    if tabela not in _colunas_movimentos:
+        with conexao() as conn:
+            _carregar_colunas_movimentos(conn.cursor())
+    return _colunas_movimentos[tabela]
+
+def _carregar_movimentos(tabela, data_inicial=None, data_final=None, colunas=None):
+    if colunas:
+        invalidas = set(colunas) - _colunas_movimento(tabela)
+        if invalidas:
+            raise ValueError(f"Colunas inexistentes em {tabela}: {', '.join(sorted(invalidas))}")
+        colunas = tuple(colunas)
+    sql, params = sql_movimentos(tabela, data_inicial, data_final, colunas)
+    return _consultar_em_cache(
+        (sql, params), (tabela,),
+        lambda conn: _tipar_movimentos(ler_sql(conn, sql, params), tabela)
+    )
+
+# Histórico paginado: coluna de pessoa / produto / nota de cada tabela
+HISTORICOS = {
+    "entradas": {"pessoa": "fornecedor", "produto": "codigo_produto", "nota": "nota_fiscal"},
+    "saidas": {"pessoa": "cliente", "produto": "codigo_produto", "nota": "nota_fiscal"},
+    "gastos": {"pessoa": "fornecedor_beneficiario", "produto": None, "nota": None},
+}
+
+@medido()
+def carregar_historico(tabela, limite=20, apos=None, codigo_produto=None,
+                       pessoa=None, nota_fiscal=None, com_nota=None):
+    """Uma página do histórico, do mais recente para o mais antigo.
+
+    Paginação por chave (data, id): apos é o (data, id) do último registro
+    da página anterior, então cada página custa o mesmo em qualquer ponto
+    do histórico. Retorna (df, proximo), onde proximo é o cursor da página
+    seguinte ou None se esta for a última. com_nota=True/False filtra pela
+    classificação gravada (entradas e saídas).
+    """
+    colunas = HISTORICOS[tabela]
+    condicoes, params = [], []
+    if apos is not None:
+        condicoes.append("(data, id) < (?, ?)")
+        params += [str(apos[0]), int(apos[1])]
+    if codigo_produto and colunas["produto"]:
+        condicoes.append(f"{colunas['produto']} = ?")
+        params.append(codigo_produto)
+    if pessoa:
+        condicoes.append(f"{colunas['pessoa']} {BACKEND.like} ? ESCAPE '\\'")
+        params.append(f"%{_escapar_like(pessoa)}%")
+    if nota_fiscal and colunas["nota"]:
+        condicoes.append(f"{colunas['nota']} {BACKEND.like} ? ESCAPE '\\'")
+        params.append(f"%{_escapar_like(nota_fiscal)}%")
+    if com_nota is not None and colunas["nota"]:
+        condicoes.append("com_nota = ?")
+        params.append(int(com_nota))
+    where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+    # Um registro a mais só para saber se existe próxima página
+    params = tuple(params) + (limite + 1,)
+    sql = f"SELECT * FROM {tabela}{where} ORDER BY data DESC, id DESC LIMIT ?"
+    df = _ler_tabela(sql, tabela, params)
+    inicio = _inicio_quente()
+    if inicio and (len(df) <= limite or str(df["data"].iloc[-1]) < inicio):
+        # A página chega aos meses arquivados: mesma consulta na visão
+        # quente + arquivo (registros arquivados continuam visíveis e excluíveis)
+        sql = f"SELECT * FROM {tabela}_todas{where} ORDER BY data DESC, id DESC LIMIT ?"
+        df = _ler_tabela(sql, tabela, params)
+
+    proximo = None
+    if len(df) > limite:
+        df = df.iloc[:limite]
+        ultimo = df.iloc[-1]
+        proximo = (ultimo["data"], int(ultimo["id"]))
+    return df, proximo
+
+# Funções para carregar dados (sem datas = todo o histórico; sem colunas = todas)
+@medido()
+def carregar_entradas(data_inicial=None, data_final=None, colunas=None):
+    return _carregar_movimentos("entradas", data_inicial, data_final, colunas)
+
+@medido()
+def carregar_saidas(data_inicial=None, data_final=None, colunas=None):
+    return _carregar_movimentos("saidas", data_inicial, data_final, colunas)
+
+@medido()
+def carregar_gastos(data_inicial=None, data_final=None, colunas=None):
+    return _carregar_movimentos("gastos", data_inicial, data_final, colunas)
+
+@medido()
+def carregar_produtos():
+    return _ler_tabela("SELECT * FROM produtos ORDER BY codigo", "produtos")
+
+# Busca de produtos (formulários de Entradas e Saídas)
+LIMITE_BUSCA = 20
+
+def _termos_fts(termo):
+    # Cada palavra vira um prefixo entre aspas: "cim"* "50"*
+    palavras = re.findall(r"\w+", termo)
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+# Definido uma vez por migrar(): o índice FTS5 existe ou não (SQLite sem
+# FTS5, PostgreSQL). As buscas só consultam esta variável.
+_busca_fts = False
+
+def _detectar_busca_fts(cursor):
+    global _busca_fts
+    _busca_fts = BACKEND.fts and BACKEND.tabela_existe(cursor, "produtos_busca")
+
+def _escapar_like(texto):
+    # % e _ digitados são procurados literalmente (ESCAPE '\' nas cláusulas)
+    return re.sub(r"([\\%_])", r"\\\1", texto)
+
+def _like_palavras(termo):
+    # Sem FTS: cada palavra precisa aparecer no código ou na descrição
+    palavras = re.findall(r"\w+", termo) or [termo]
+    condicao = " AND ".join(
+        f"(codigo {BACKEND.like} ? ESCAPE '\\' OR descricao {BACKEND.like} ? ESCAPE '\\')" for _ in palavras
+    )
+    return f"({condicao})", tuple(padrao for palavra in palavras
+                                   for padrao in [f"%{_escapar_like(palavra)}%"] * 2)
+
+def _filtro_produtos(termo):
+    """Cláusula WHERE dos produtos que casam com o termo (mesma regra de buscar_produtos)"""
+    termo = (termo or "").strip()
+    consulta = _termos_fts(termo) if _busca_fts else ""
+    if consulta:
+        return "id IN (SELECT rowid FROM produtos_busca WHERE produtos_busca MATCH ?)", (consulta,)
+    if termo:
+        return _like_palavras(termo)
+    return "", ()
+
+@medido()
+def buscar_produtos(termo, limite=LIMITE_BUSCA):
+    """Até `limite` produtos cujo código ou descrição casam com o termo.
+
+    Com FTS5, cada palavra é buscada por prefixo e o resultado vem
+    ordenado por relevância (bm25, código com peso maior); o código
+    idêntico ao termo vem primeiro, depois os que começam por ele.
+    Sem FTS5 (e no PostgreSQL), cada palavra deve aparecer no código ou
+    na descrição. Termo vazio: os primeiros códigos.
+    """
+    termo = (termo or "").strip()
+    consulta = _termos_fts(termo) if _busca_fts else ""
+    if not consulta:
+        if termo:
+            condicao, params = _like_palavras(termo)
+            sql = f"""
+                SELECT codigo, descricao, unidade, preco_sugerido FROM produtos
+                WHERE {condicao}
+                ORDER BY codigo != ?, codigo NOT {BACKEND.like} ? ESCAPE '\\', codigo LIMIT ?
+            """
+            params = params + (termo, f"{_escapar_like(termo)}%", int(limite))
+        else:
+            sql = "SELECT codigo, descricao, unidade, preco_sugerido FROM produtos ORDER BY codigo LIMIT ?"
+            params = (int(limite),)
+    else:
+        sql = """
+            SELECT p.codigo, p.descricao, p.unidade, p.preco_sugerido
+            FROM produtos_busca b
+            JOIN produtos p ON p.id = b.rowid
+            WHERE produtos_busca MATCH ?
+            ORDER BY p.codigo != ?, p.codigo NOT LIKE ?, bm25(produtos_busca, 10.0, 1.0), p.codigo
+            LIMIT ?
+        """
+        params = (consulta, termo, f"{termo}%", int(limite))
+    return _consultar_em_cache((sql, params), ("produtos",),
+                               lambda conn: ler_sql(conn, sql, params))
+
+def produtos_por_codigo():
+    """{codigo: {descricao, unidade, preco_sugerido, ...}} do catálogo inteiro.
+
+    Montado uma vez por versão da tabela de produtos e compartilhado pelas
+    sessões; consultar um código é uma busca no dict, sem varrer o DataFrame.
+    """
+    return em_cache(("produtos_por_codigo",), ("produtos",),
+                    lambda: carregar_produtos().set_index("codigo").to_dict("index"))
+
+# Resumos por período (tabelas de resumo diário)
+@medido()
+def carregar_resumo_periodo(data_inicial=None, data_final=None):
+    """Registros, quantidade e valor do período por tabela e com/sem nota"""
+    where, params = _filtro_periodo(data_inicial, data_final)
+    sql = f"""
+        SELECT tabela, com_nota, SUM(registros) AS registros,
+               SUM(quantidade) AS quantidade, SUM(valor) AS valor
+        FROM resumo_diario{where}
+        GROUP BY tabela, com_nota
+    """
+    return _consultar_em_cache((sql, params), ("entradas", "saidas", "gastos", "resumos"),
+                               lambda conn: ler_sql(conn, sql, params))
+
+@medido()
+def carregar_resumo_produtos(tabela, data_inicial=None, data_final=None):
+    """Quantidade e valor do período por produto e com/sem nota"""
+    where, params = _filtro_periodo(data_inicial, data_final, coluna="r.data")
+    where = (where + " AND" if where else " WHERE") + " r.tabela = ?"
+    sql = f"""
+        SELECT r.codigo_produto, COALESCE(MAX(p.descricao), r.codigo_produto) AS descricao_produto,
+               MAX(p.unidade) AS unidade,
+               CASE WHEN r.com_nota = 1 THEN 'Com nota' ELSE 'Sem nota' END AS tem_nota,
+               SUM(r.quantidade) AS quantidade, SUM(r.valor) AS valor
+        FROM resumo_diario_produto r
+        LEFT JOIN produtos p ON p.codigo = r.codigo_produto{where}
+        GROUP BY r.codigo_produto, r.com_nota
+        ORDER BY r.codigo_produto, r.com_nota DESC
+    """
+    params = params + (tabela,)
+    return _consultar_em_cache((sql, params), (tabela, "produtos", "resumos"),
+                               lambda conn: ler_sql(conn, sql, params))
+
+@medido()
+def carregar_resumo_categorias(data_inicial=None, data_final=None):
+    """Registros e valor dos gastos do período por categoria"""
+    where, params = _filtro_periodo(data_inicial, data_final)
+    sql = f"""
+        SELECT categoria, SUM(registros) AS registros, SUM(valor) AS valor
+        FROM resumo_diario_categoria{where}
+        GROUP BY categoria
+        ORDER BY valor DESC
+    """
+    return _consultar_em_cache((sql, params), ("gastos", "resumos"),
+                               lambda conn: ler_sql(conn, sql, params))
+
+# Séries temporais (Dashboard)
+# Expressão SQL do início de cada intervalo e frequência equivalente do pandas
+GRANULARIDADES = {
+    "dia": ("Dia", BACKEND.intervalos["dia"], "D"),
+    "semana": ("Semana", BACKEND.intervalos["semana"], "W-MON"),
+    "mes": ("Mês", BACKEND.intervalos["mes"], "MS"),
+    "ano": ("Ano", BACKEND.intervalos["ano"], "YS"),
+}
+MAX_PONTOS_SERIE = 120   # pontos por linha enviados ao gráfico
+
+def escolher_granularidade(data_inicial, data_final):
+    """Menor intervalo que mantém a série em até MAX_PONTOS_SERIE pontos"""
+    if data_inicial is None or data_final is None:
+        return "mes"
+    dias = (data_final - data_inicial).days + 1
+    if dias <= MAX_PONTOS_SERIE:
+        return "dia"
+    if dias / 7 <= MAX_PONTOS_SERIE:
+        return "semana"
+    if dias / 30 <= MAX_PONTOS_SERIE:
+        return "mes"
+    return "ano"
+
+@medido()
+def carregar_serie_temporal(data_inicial=None, data_final=None, granularidade="auto"):
+    """Vendas, compras e gastos por dia/semana/mês (uma linha por intervalo).
+
+    Agrega os resumos diários no próprio SQL; intervalos sem movimento
+    aparecem com zero para a linha do gráfico não ligar pontos distantes.
+    """
+    if granularidade == "auto":
+        granularidade = escolher_granularidade(data_inicial, data_final)
+    _, expressao, frequencia = GRANULARIDADES[granularidade]
+    where, params = _filtro_periodo(data_inicial, data_final)
+    sql = f"""
+        SELECT {expressao} AS periodo,
+               SUM(CASE WHEN tabela = 'saidas' THEN valor ELSE 0 END) AS vendas,
+               SUM(CASE WHEN tabela = 'entradas' THEN valor ELSE 0 END) AS compras,
+               SUM(CASE WHEN tabela = 'gastos' THEN valor ELSE 0 END) AS gastos
+        FROM resumo_diario{where}
+        GROUP BY 1
+        ORDER BY 1
+    """
+
+    def carregar(conn):
+        df = ler_sql(conn, sql, params, parse_dates=["periodo"])
+        if df.empty:
+            return df
+        inicio = df["periodo"].min() if data_inicial is None else pd.Timestamp(data_inicial)
+        fim = df["periodo"].max() if data_final is None else pd.Timestamp(data_final)
+        # Âncora no início do intervalo que contém a data inicial
+        if granularidade == "semana":
+            inicio -= pd.Timedelta(days=inicio.weekday())
+        elif granularidade == "mes":
+            inicio = inicio.replace(day=1)
+        elif granularidade == "ano":
+            inicio = inicio.replace(month=1, day=1)
+        intervalos = pd.date_range(inicio, fim, freq=frequencia)
+        df = df.set_index("periodo").reindex(intervalos, fill_value=0.0)
+        return df.rename_axis("periodo").reset_index()
+
+    return _consultar_em_cache(("serie", sql, params), ("entradas", "saidas", "gastos", "resumos"), carregar)
+
+def em_cache(chave, tabelas, gerar):
+    """Guarda no cache de consultas qualquer objeto derivado das tabelas
+    (ex.: figuras do Plotly); gerar() só roda quando alguma versão mudou."""
+    return _consultar_em_cache(chave, tabelas, lambda conn: gerar())
+
+# Ranking de produtos (Relatórios)
+CRITERIOS_RANKING = {"receita": "Faturamento", "quantidade": "Quantidade vendida", "margem": "Margem"}
+
+@medido()
+def carregar_ranking_produtos(data_inicial=None, data_final=None, criterio="receita", limite=10):
+    """Top-N produtos vendidos no período, por código de produto.
+
+    Soma os resumos diários (sem ler as saídas). A margem usa o custo médio
+    atual de cada produto (tabela de estoque): receita - quantidade * custo.
+    """
+    if criterio not in CRITERIOS_RANKING:
+        raise ValueError(f"Critério inválido: {criterio}")
+    where, params = _filtro_periodo(data_inicial, data_final, coluna="r.data")
+    where = (where + " AND" if where else " WHERE") + " r.tabela = 'saidas'"
+    sql = f"""
+        SELECT codigo_produto, descricao_produto, unidade, quantidade, receita,
+               quantidade * custo_medio AS custo,
+               receita - quantidade * custo_medio AS margem,
+               CASE WHEN receita > 0 THEN (receita - quantidade * custo_medio) / receita END AS margem_pct
+        FROM (
+            SELECT r.codigo_produto, COALESCE(MAX(p.descricao), r.codigo_produto) AS descricao_produto,
+                   MAX(p.unidade) AS unidade,
+                   SUM(r.quantidade) AS quantidade, SUM(r.valor) AS receita,
+                   COALESCE(MAX(e.custo_total_entradas / NULLIF(e.qtd_entradas, 0)), 0) AS custo_medio
+            FROM resumo_diario_produto r
+            LEFT JOIN produtos p ON p.codigo = r.codigo_produto
+            LEFT JOIN estoque e ON e.codigo = r.codigo_produto{where}
+            GROUP BY r.codigo_produto
+        ) t
+        ORDER BY {criterio} DESC, codigo_produto
+        LIMIT ?
+    """
+    params = params + (int(limite),)
+    return _consultar_em_cache((sql, params), ("saidas", "entradas", "produtos", "estoque", "resumos"),
+                               lambda conn: ler_sql(conn, sql, params))
+
+@medido()
+def carregar_vendas_por_mes(codigo_produto, data_inicial=None, data_final=None):
+    """Quantidade e receita de um produto por mês (dos resumos diários)"""
+    where, params = _filtro_periodo(data_inicial, data_final)
+    where = (where + " AND" if where else " WHERE") + " tabela = 'saidas' AND codigo_produto = ?"
+    sql = f"""
+        SELECT {BACKEND.mes("data")} AS mes, SUM(quantidade) AS quantidade, SUM(valor) AS receita
+        FROM resumo_diario_produto{where}
+        GROUP BY mes
+        ORDER BY mes
+    """
+    params = params + (codigo_produto,)
+    return _consultar_em_cache((sql, params), ("saidas", "resumos"),
+                               lambda conn: ler_sql(conn, sql, params))
+
+@medido()
+def carregar_vendas_por_cliente(codigo_produto, data_inicial=None, data_final=None):
+    """Quantidade e receita de um produto por cliente no período.
+
+    Lê só as saídas do produto no período, pelo índice idx_saidas_produto
+    (e pelo do arquivo, se o período alcança meses arquivados).
+    """
+    where, params = _filtro_periodo(data_inicial, data_final)
+    where = (where + " AND" if where else " WHERE") + " codigo_produto = ?"
+    sql = f"""
+        SELECT COALESCE(NULLIF(TRIM(cliente), ''), '(sem cliente)') AS cliente,
+               COUNT(*) AS vendas, SUM(quantidade) AS quantidade, SUM(total_venda) AS receita
+        FROM {fonte_movimentos("saidas", data_inicial)}{where}
+        GROUP BY 1
+        ORDER BY receita DESC
+    """
+    params = params + (codigo_produto,)
+    return _consultar_em_cache((sql, params), ("saidas",),
+                               lambda conn: ler_sql(conn, sql, params))
+
+def reconstruir_resumos():
+    """Refaz os resumos diários a partir das movimentações"""
+    with transacao() as cursor:
+        resumos.reconstruir(cursor)
+        _incrementar_versao(cursor, "resumos")
+
+def ler_em_lotes(sql, params=(), tamanho=5000):
+    """Percorre o resultado em lotes, sem montar DataFrame.
+
+    Gera (colunas, linhas) com no máximo `tamanho` linhas por vez (pelo
+    menos um lote, mesmo vazio), então a memória usada não depende do
+    tamanho da tabela.
+    """
+    with conexao() as conn:
+        # No PostgreSQL, por um cursor do lado do servidor
+        yield from BACKEND.ler_em_lotes(conn, sql, params, tamanho)
+
+def tipos_colunas(tabela):
+    """Tipo declarado de cada coluna da tabela ({coluna: tipo})"""
+    with conexao() as conn:
+        return dict(BACKEND.colunas(conn.cursor(), tabela))
+
+# ==============================
+# ESTOQUE (SALDO POR PRODUTO)
+# ==============================
+def _movimentar_estoque(cursor, codigo, qtd_entradas=0.0, qtd_saidas=0.0, custo_total=0.0):
+    """Aplica uma movimentação ao saldo do produto (na transação do cursor).
+
+    Guardar quantidade e custo total das entradas mantém o custo médio
+    ponderado atualizado a cada entrada, sem reprocessar o histórico.
+    """
+    _movimentar_estoque_varios(cursor, [(codigo, qtd_entradas, qtd_saidas, custo_total)])
+
+def _movimentar_estoque_varios(cursor, movimentos):
+    """Idem para vários produtos: [(codigo, qtd_entradas, qtd_saidas, custo_total)]"""
+    cursor.executemany("""
+        INSERT INTO estoque (codigo, qtd_entradas, qtd_saidas, custo_total_entradas)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (codigo) DO UPDATE SET
+            qtd_entradas = estoque.qtd_entradas + excluded.qtd_entradas,
+            qtd_saidas = estoque.qtd_saidas + excluded.qtd_saidas,
+            custo_total_entradas = estoque.custo_total_entradas + excluded.custo_total_entradas
+    """, movimentos)
+    cursor.executemany(_SQL_ATUALIZAR_SALDO, [(mov[0],) for mov in movimentos])
+
+class EstoqueInsuficiente(ValueError):
+    """Itens sem saldo; faltas = [(codigo, pedido, disponivel)]"""
+
+    def __init__(self, faltas):
+        self.faltas = faltas
+        super().__init__("Estoque insuficiente: " + ", ".join(
+            f"{codigo} (pedido {pedido:g}, disponível {disponivel:g})"
+            for codigo, pedido, disponivel in faltas
+        ))
+
+def _baixar_estoque(cursor, quantidades):
+    """Desconta {codigo: quantidade} do estoque, só se houver saldo.
+
+    O UPDATE condicional confere e baixa o saldo no mesmo comando, pela
+    chave da tabela de estoque, sem recalcular o inventário. No SQLite a
+    transação já reservou a escrita (BEGIN IMMEDIATE); no PostgreSQL o
+    UPDATE trava a linha e reavalia a condição. Assim duas vendas ao mesmo
+    tempo não vendem o mesmo saldo. Se faltar em algum item, levanta
+    EstoqueInsuficiente e quem chama desfaz a transação inteira.
+    """
+    faltas = []
+    for codigo, quantidade in quantidades.items():
+        cursor.execute("""
+            UPDATE estoque
+            SET qtd_saidas = qtd_saidas + ?, estoque_atual = estoque_atual - ?
+            WHERE codigo = ? AND estoque_atual >= ? - 1e-9
+        """, (quantidade, quantidade, codigo, quantidade))
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT estoque_atual FROM estoque WHERE codigo = ?", (codigo,))
+            saldo = cursor.fetchone()
+            faltas.append((codigo, quantidade, saldo[0] if saldo else 0.0))
+    if faltas:
+        raise EstoqueInsuficiente(faltas)
+
+def _invalidar_snapshots(cursor, data):
+    """Descarta as fotografias mensais a partir do mês de `data`.
+
+    Chamado por toda escrita em entradas/saídas: um lançamento retroativo
+    muda o saldo acumulado dos meses seguintes. Elas são refeitas sob demanda.
+    """
+    if data is None:
+        return
+    mes = str(data)[:7]
+    cursor.execute("DELETE FROM estoque_mensal WHERE mes >= ?", (mes,))
+    cursor.execute("DELETE FROM snapshots_estoque WHERE mes >= ?", (mes,))
+
+_SQL_ATUALIZAR_SALDO = """
+    UPDATE estoque SET estoque_atual = COALESCE(
+        (SELECT estoque_inicial FROM produtos WHERE codigo = estoque.codigo), 0
+    ) + qtd_entradas - qtd_saidas
+    WHERE codigo = ?
+"""
+
+def _atualizar_saldo(cursor, codigo):
+    """Recalcula estoque_atual = estoque inicial + entradas - saídas"""
+    cursor.execute(_SQL_ATUALIZAR_SALDO, (codigo,))
+
+def _agregar_movimentacoes(cursor, arquivo=True):
+    """Soma as movimentações brutas por produto (fonte da verdade do estoque)"""
+    sufixo = "_todas" if arquivo else ""
+    cursor.execute(f"""
+        SELECT codigo, SUM(qtd_entradas), SUM(qtd_saidas), SUM(custo_total_entradas)
+        FROM (
+            SELECT codigo_produto AS codigo, quantidade AS qtd_entradas, 0 AS qtd_saidas,
+                   custo_total AS custo_total_entradas
+            FROM entradas{sufixo}
+            UNION ALL
+            SELECT codigo_produto, 0, quantidade, 0 FROM saidas{sufixo}
+            UNION ALL
+            SELECT codigo, 0, 0, 0 FROM produtos
+        ) m
+        GROUP BY codigo
+    """)
+    return cursor.fetchall()
+
+def _reconstruir_estoque(cursor, arquivo=True):
+    cursor.execute("DELETE FROM estoque")
+    cursor.executemany("""
+        INSERT INTO estoque (codigo, qtd_entradas, qtd_saidas, custo_total_entradas)
+        VALUES (?, ?, ?, ?)
+    """, _agregar_movimentacoes(cursor, arquivo))
+    cursor.execute("""
+        UPDATE estoque SET estoque_atual = COALESCE(
+            (SELECT estoque_inicial FROM produtos WHERE codigo = estoque.codigo), 0
+        ) + qtd_entradas - qtd_saidas
+    """)
+    _incrementar_versao(cursor, "estoque")
+
+def reconstruir_estoque(apenas_verificar=False, tolerancia=1e-6):
+    """Confere a tabela de estoque contra as movimentações e a reconstrói.
+
+    Retorna a lista de divergências encontradas (codigo, coluna, gravado, esperado).
+    Com apenas_verificar=True a tabela não é alterada.
+    """
+    with transacao() as cursor:
+        return _conferir_estoque(cursor, apenas_verificar, tolerancia)
+
+def _conferir_estoque(cursor, apenas_verificar, tolerancia):
+    esperado = {row[0]: row[1:] for row in _agregar_movimentacoes(cursor)}
+    cursor.execute("""
+        SELECT codigo, qtd_entradas, qtd_saidas, custo_total_entradas
+        FROM estoque
+    """)
+    gravado = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    colunas = ["qtd_entradas", "qtd_saidas", "custo_total_entradas"]
+    divergencias = []
+    for codigo in sorted(set(esperado) | set(gravado)):
+        valores_esp = esperado.get(codigo, (0,) * len(colunas))
+        valores_grav = gravado.get(codigo, (0,) * len(colunas))
+        for coluna, v_grav, v_esp in zip(colunas, valores_grav, valores_esp):
+            if abs((v_grav or 0) - (v_esp or 0)) > tolerancia:
+                divergencias.append((codigo, coluna, v_grav, v_esp))
+
+    if not apenas_verificar:
+        _reconstruir_estoque(cursor)
+        _invalidar_snapshots(cursor, "0000-00")   # refeitas a partir das movimentações
+    return divergencias
+
+@medido()
+def consultar_estoque(codigo):
+    """Estoque atual de um produto (consulta pela chave da tabela de estoque)"""
+    with conexao() as conn:
+        result = conn.execute("SELECT estoque_atual FROM estoque WHERE codigo = ?", (codigo,)).fetchone()
+    return result[0] if result else 0.0
+
+# Funções para inserir dados
+@medido()
+def inserir_entrada(data, codigo, descricao, unidade, quantidade, fornecedor,
+                   custo_unit, custo_total, nf, forma_pag, obs, usuario):
+    with transacao() as cursor:
+        cursor.execute("""
+            INSERT INTO entradas (data, codigo_produto, descricao_produto, unidade,
+                                quantidade, fornecedor, custo_unitario, custo_total,
+                                nota_fiscal, forma_pagamento, observacoes, usuario_registro,
+                                com_nota)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (data, codigo, descricao, unidade, quantidade, fornecedor,
+              custo_unit, custo_total, nf, forma_pag, obs, usuario, int(resumos.tem_nota_fiscal(nf))))
+        _movimentar_estoque(cursor, codigo, qtd_entradas=quantidade, custo_total=custo_total)
+        _invalidar_snapshots(cursor, data)
+        resumos.registrar(cursor, "entradas", data, custo_total, quantidade,
+                          codigo_produto=codigo, nota_fiscal=nf)
+        _incrementar_versao(cursor, "entradas")
+
+@medido()
+def inserir_saida(data, codigo, descricao, unidade, quantidade, cliente,
+                 preco_unit, total, nf, forma_pag, obs, usuario):
+    with transacao() as cursor:
+        cursor.execute("""
+            INSERT INTO saidas (data, codigo_produto, descricao_produto, unidade,
+                              quantidade, cliente, preco_unitario, total_venda,
+                              nota_fiscal, forma_pagamento, observacoes, usuario_registro,
+                              com_nota)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (data, codigo, descricao, unidade, quantidade, cliente,
+              preco_unit, total, nf, forma_pag, obs, usuario, int(resumos.tem_nota_fiscal(nf))))
+        _baixar_estoque(cursor, {codigo: quantidade})
+        _invalidar_snapshots(cursor, data)
+        resumos.registrar(cursor, "saidas", data, total, quantidade,
+                          codigo_produto=codigo, nota_fiscal=nf)
+        _incrementar_versao(cursor, "saidas")
+
+@medido()
+def inserir_gasto(data, categoria, descricao, fornecedor, valor, forma_pag, obs, usuario):
+    with transacao() as cursor:
+        cursor.execute("""
+            INSERT INTO gastos (data, categoria, descricao, fornecedor_beneficiario,
+                              valor, forma_pagamento, observacoes, usuario_registro)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (data, categoria, descricao, fornecedor, valor, forma_pag, obs, usuario))
+        resumos.registrar(cursor, "gastos", data, valor, categoria=categoria)
+        _incrementar_versao(cursor, "gastos")
+
+@medido()
+def inserir_produto(codigo, descricao, unidade, preco, est_min, est_inicial):
+    try:
+        with transacao() as cursor:
+            cursor.execute("""
+                INSERT INTO produtos (codigo, descricao, unidade, preco_sugerido,
+                                    estoque_minimo, estoque_inicial)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (codigo, descricao, unidade, preco, est_min, est_inicial))
+            _movimentar_estoque(cursor, codigo)
+            _incrementar_versao(cursor, "produtos")
+        return True
+    except BACKEND.erros_integridade:
+        return False
+
+# Funções para excluir dados
+def _remover_movimento(cursor, tabela, id_registro, colunas):
+    """Apaga o registro da tabela quente ou, se já foi arquivado, do arquivo,
+    descontando-o do resumo do mês em meses_arquivados.
+
+    Devolve os valores de `colunas` do registro apagado (None se não existe).
+    """
+    cursor.execute(f"SELECT {colunas} FROM {tabela} WHERE id = ?", (id_registro,))
+    registro = cursor.fetchone()
+    if registro:
+        cursor.execute(f"DELETE FROM {tabela} WHERE id = ?", (id_registro,))
+        return registro
+
+    quantidade = "0" if tabela == "gastos" else "quantidade"
+    cursor.execute(f"""
+        SELECT {colunas}, {BACKEND.mes("data")}, {quantidade}, {resumos.COLUNAS_VALOR[tabela]}
+        FROM {tabela}_arquivo WHERE id = ?
+    """, (id_registro,))
+    registro = cursor.fetchone()
+    if registro is None:
+        return None
+    cursor.execute(f"DELETE FROM {tabela}_arquivo WHERE id = ?", (id_registro,))
+    mes, qtd, valor = registro[-3:]
+    cursor.execute("""
+        UPDATE meses_arquivados
+        SET registros = registros - 1, quantidade = quantidade - ?, valor = valor - ?
+        WHERE mes = ? AND tabela = ?
+    """, (qtd or 0, valor or 0, mes, tabela))
+    return registro[:-3]
+
+@medido()
+def excluir_entrada(id_registro):
+    with transacao() as cursor:
+        registro = _remover_movimento(cursor, "entradas", id_registro,
+                                      "data, codigo_produto, quantidade, custo_total, nota_fiscal")
+        if registro:
+            data, codigo, quantidade, custo_total, nf = registro
+            _movimentar_estoque(cursor, codigo, qtd_entradas=-quantidade, custo_total=-custo_total)
+            _invalidar_snapshots(cursor, data)
+            resumos.registrar(cursor, "entradas", data, custo_total, quantidade,
+                              codigo_produto=codigo, nota_fiscal=nf, sinal=-1)
+        _incrementar_versao(cursor, "entradas")
+
+@medido()
+def excluir_saida(id_registro):
+    with transacao() as cursor:
+        registro = _remover_movimento(cursor, "saidas", id_registro,
+                                      "data, codigo_produto, quantidade, total_venda, nota_fiscal")
+        if registro:
+            data, codigo, quantidade, total, nf = registro
+            _movimentar_estoque(cursor, codigo, qtd_saidas=-quantidade)
+            _invalidar_snapshots(cursor, data)
+            resumos.registrar(cursor, "saidas", data, total, quantidade,
+                              codigo_produto=codigo, nota_fiscal=nf, sinal=-1)
+        _incrementar_versao(cursor, "saidas")
+
+@medido()
+def excluir_gasto(id_registro):
+    with transacao() as cursor:
+        registro = _remover_movimento(cursor, "gastos", id_registro, "data, categoria, valor")
+        if registro:
+            data, categoria, valor = registro
+            resumos.registrar(cursor, "gastos", data, valor, categoria=categoria, sinal=-1)
+        _incrementar_versao(cursor, "gastos")
+
+@medido()
+def excluir_produto(codigo):
+    excluir_produtos([codigo])
+
+@medido(conta_linhas=True)
+def excluir_produtos(codigos):
+    """Exclui vários produtos em uma transação"""
+    linhas = [(codigo,) for codigo in codigos]
+    with transacao() as cursor:
+        cursor.executemany("DELETE FROM produtos WHERE codigo = ?", linhas)
+        # O saldo volta a ser só das movimentações (sem estoque inicial)
+        cursor.executemany(_SQL_ATUALIZAR_SALDO, linhas)
+        _incrementar_versao(cursor, "produtos")
+    return len(linhas)
+
+# Catálogo paginado e edição em lote (aba Produtos)
+@medido()
+def carregar_pagina_produtos(limite=50, apos=None, termo=None):
+    """Uma página do catálogo em ordem de código, opcionalmente filtrada.
+
+    Paginação por chave: apos é o último código da página anterior.
+    Retorna (df, proximo), com proximo None na última página.
+    """
+    filtro, params = _filtro_produtos(termo)
+    condicoes = [filtro] if filtro else []
+    if apos is not None:
+        condicoes.append("codigo > ?")
+        params += (apos,)
+    where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    sql = f"SELECT * FROM produtos{where} ORDER BY codigo LIMIT ?"
+    df = _ler_tabela(sql, "produtos", params + (limite + 1,))
+
+    proximo = None
+    if len(df) > limite:
+        df = df.iloc[:limite]
+        proximo = df["codigo"].iloc[-1]
+    return df, proximo
+
+@medido(conta_linhas=True)
+def atualizar_produtos(alteracoes):
+    """Grava [(codigo, preco_sugerido, estoque_minimo)] em uma transação"""
+    # Célula apagada no editor chega como NaN; as colunas são NOT NULL
+    vazios = [codigo for codigo, preco, est_min in alteracoes if pd.isna(preco) or pd.isna(est_min)]
+    if vazios:
+        raise ValueError(f"Preço e estoque mínimo são obrigatórios: {', '.join(vazios)}")
+    with transacao() as cursor:
+        cursor.executemany(
+            "UPDATE produtos SET preco_sugerido = ?, estoque_minimo = ? WHERE codigo = ?",
+            [(preco, est_min, codigo) for codigo, preco, est_min in alteracoes]
+        )
+        _incrementar_versao(cursor, "produtos")
+    return len(alteracoes)
+
+@medido(conta_linhas=True)
+def reajustar_precos(percentual, termo=None):
+    """Reajusta em `percentual`% o preço sugerido dos produtos que casam com
+    o termo (todos, sem termo), em um único UPDATE. Devolve quantos mudaram."""
+    if percentual <= -100:
+        raise ValueError(f"Reajuste deixaria preços zerados ou negativos: {percentual}%")
+    with transacao() as cursor:
+        filtro, params = _filtro_produtos(termo)
+        where = f" WHERE {filtro}" if filtro else ""
+        cursor.execute(
+            f"UPDATE produtos SET preco_sugerido = ROUND(CAST(preco_sugerido * (1 + ? / 100.0) AS NUMERIC), 2){where}",
+            (percentual,) + params
+        )
+        alterados = cursor.rowcount
+        _incrementar_versao(cursor, "produtos")
+    return alterados
+
+# Inserção em lote (importação e pedidos)
+def _gravar_linhas(cursor, tabela, linhas, tamanho_lote=1000, atualizar_estoque=True):
+    """Insere as linhas e atualiza estoque, resumos e versão na transação
+    de `cursor`. Devolve o maior id anterior: as novas linhas têm id maior.
+    atualizar_estoque=False quando o saldo já foi baixado (_baixar_estoque).
+    """
+    colunas = COLUNAS_INSERCAO[tabela]
+    if "nota_fiscal" in colunas:
+        # Classificação com/sem nota calculada aqui, como em inserir_entrada/saida
+        indice_nota = colunas.index("nota_fiscal")
+        linhas = [tuple(linha) + (int(resumos.tem_nota_fiscal(linha[indice_nota])),) for linha in linhas]
+        colunas = colunas + ["com_nota"]
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {tabela}")
+    ultimo_id = cursor.fetchone()[0]
+
+    # executemany no SQLite, COPY no PostgreSQL
+    BACKEND.copiar(cursor, tabela, colunas, linhas, tamanho_lote)
+
+    if atualizar_estoque and tabela == "produtos":
+        _movimentar_estoque_varios(cursor, [(linha[0], 0, 0, 0) for linha in linhas])
+    elif atualizar_estoque and tabela == "entradas":
+        cursor.execute("""
+            SELECT codigo_produto, SUM(quantidade), 0, SUM(custo_total)
+            FROM entradas WHERE id > ? GROUP BY codigo_produto
+        """, (ultimo_id,))
+        _movimentar_estoque_varios(cursor, cursor.fetchall())
+    elif atualizar_estoque and tabela == "saidas":
+        cursor.execute("""
+            SELECT codigo_produto, 0, SUM(quantidade), 0
+            FROM saidas WHERE id > ? GROUP BY codigo_produto
+        """, (ultimo_id,))
+        _movimentar_estoque_varios(cursor, cursor.fetchall())
+
+    if tabela in ("entradas", "saidas"):
+        cursor.execute(f"SELECT MIN(data) FROM {tabela} WHERE id > ?", (ultimo_id,))
+        _invalidar_snapshots(cursor, cursor.fetchone()[0])
+    if tabela in resumos.COLUNAS_VALOR:
+        resumos.registrar_novos(cursor, tabela, ultimo_id)
+    _incrementar_versao(cursor, tabela)
+    return ultimo_id
+
+@medido(conta_linhas=True)
+def inserir_lote(tabela, linhas, tamanho_lote=1000):
+    """Insere muitas linhas em uma única transação.
+
+    linhas: lista de tuplas na ordem de COLUNAS_INSERCAO[tabela].
+    O executemany vai em lotes de `tamanho_lote`; estoque e resumos são
+    atualizados uma vez no fim, por produto/dia, e não linha a linha.
+    Qualquer erro desfaz a importação inteira.
+    """
+    with transacao() as cursor:
+        _gravar_linhas(cursor, tabela, linhas, tamanho_lote)
+    return len(linhas)
+
+# Pedidos com vários itens
+def _catalogo(cursor, codigos):
+    """{codigo: (descricao, unidade)} dos códigos, numa consulta"""
+    marcadores = ", ".join("?" for _ in codigos)
+    cursor.execute(f"SELECT codigo, descricao, unidade FROM produtos WHERE codigo IN ({marcadores})",
+                   list(codigos))
+    return {codigo: (descricao, unidade) for codigo, descricao, unidade in cursor.fetchall()}
+
+@medido()
+def inserir_pedido(tabela, data, pessoa, nota_fiscal, forma_pagamento, observacoes, usuario, itens):
+    """Grava um pedido de venda (saidas) ou compra (entradas) com vários itens.
+
+    itens: lista de (codigo, quantidade, preco_unitario). Descrição e unidade
+    vêm do cadastro. Tudo acontece em uma transação: os códigos são
+    conferidos em uma consulta e, nas vendas, o saldo de cada produto é
+    baixado por _baixar_estoque; qualquer problema (ValueError /
+    EstoqueInsuficiente) desfaz o pedido inteiro. Devolve o id do pedido.
+    """
+    if tabela not in ("entradas", "saidas"):
+        raise ValueError(f"Tabela inválida para pedido: {tabela}")
+    if not itens:
+        raise ValueError("Pedido sem itens")
+
+    # Mesmo produto em várias linhas conta uma vez no estoque
+    quantidades = {}
+    for codigo, quantidade, _ in itens:
+        if quantidade <= 0:
+            raise ValueError(f"Quantidade inválida para {codigo}")
+        quantidades[codigo] = quantidades.get(codigo, 0.0) + quantidade
+
+    with transacao() as cursor:
+        catalogo = _catalogo(cursor, quantidades)
+        faltando = [codigo for codigo in quantidades if codigo not in catalogo]
+        if faltando:
+            raise ValueError(f"Produto não cadastrado: {', '.join(faltando)}")
+        if tabela == "saidas":
+            _baixar_estoque(cursor, quantidades)
+
+        cursor.execute("""
+            INSERT INTO pedidos (tipo, data, pessoa, nota_fiscal, com_nota, forma_pagamento,
+                                 observacoes, usuario_registro)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, (tabela, data, pessoa, nota_fiscal, int(resumos.tem_nota_fiscal(nota_fiscal)),
+              forma_pagamento, observacoes, usuario))
+        pedido_id = cursor.fetchone()[0]
+
+        # Mesma ordem de COLUNAS_INSERCAO (fornecedor/cliente na 6ª posição)
+        linhas = [
+            (data, codigo, catalogo[codigo][0], catalogo[codigo][1], quantidade, pessoa,
+             preco_unitario, quantidade * preco_unitario, nota_fiscal, forma_pagamento,
+             observacoes, usuario)
+            for codigo, quantidade, preco_unitario in itens
+        ]
+        ultimo_id = _gravar_linhas(cursor, tabela, linhas, atualizar_estoque=tabela == "entradas")
+        cursor.execute(f"UPDATE {tabela} SET pedido_id = ? WHERE id > ?", (pedido_id, ultimo_id))
+        _incrementar_versao(cursor, "pedidos")
+    return pedido_id
+
+@medido()
+def calcular_estoque_atual(metodo="media"):
+    """Estoque atual e valor por produto, lidos da tabela de estoque.
+
+    metodo: "media" (custo médio ponderado) ou "fifo" (PEPS).
+    """
+    def carregar(conn):
+        df = ler_sql(conn, """
+            SELECT p.*,
+                   COALESCE(e.qtd_entradas, 0) AS qtd_entradas,
+                   COALESCE(e.qtd_saidas, 0) AS qtd_saidas,
+                   COALESCE(e.estoque_atual, p.estoque_inicial) AS estoque_atual,
+                   COALESCE(e.custo_total_entradas, 0) AS custo_total_entradas
+            FROM produtos p
+            LEFT JOIN estoque e ON e.codigo = p.codigo
+            ORDER BY p.codigo
+        """)
+
+        entradas = None
+        if metodo == "fifo":
+            entradas = ler_sql(
+                conn, "SELECT id, data, codigo_produto, quantidade, custo_unitario FROM entradas_todas"
+            )
+
+        with medir("valorizar_estoque", metodo=metodo):
+            df = valorizar_estoque(df, metodo=metodo, entradas=entradas)
+        return df.drop(columns=["custo_total_entradas"])
+
+    return _consultar_em_cache(("estoque", metodo),
+                               ("produtos", "entradas", "saidas", "estoque"), carregar)
+
+# ==============================
+# ESTOQUE EM UMA DATA
+# ==============================
+# Saldo em qualquer data = fotografia acumulada do fim do mês anterior
+# + movimentações do próprio mês até a data (índices idx_*_data). As
+# fotografias são geradas sob demanda, mês a mês, a partir da anterior.
+def _mes_seguinte(mes):
+    ano, m = int(mes[:4]), int(mes[5:7])
+    return f"{ano + m // 12:04d}-{m % 12 + 1:02d}"
+
+def _mes_anterior(mes):
+    ano, m = int(mes[:4]), int(mes[5:7])
+    return f"{ano - (m == 1):04d}-{(m - 2) % 12 + 1:02d}"
+
+# Movimentações acumuladas por produto: fotografia de um mês + intervalo de datas
+_SQL_ACUMULADO = """
+    SELECT codigo, SUM(qe) AS qtd_entradas, SUM(qs) AS qtd_saidas, SUM(ct) AS custo_total_entradas
+    FROM (
+        SELECT codigo, qtd_entradas AS qe, qtd_saidas AS qs, custo_total_entradas AS ct
+        FROM estoque_mensal WHERE mes = ?
+        UNION ALL
+        SELECT codigo_produto, SUM(quantidade), 0, SUM(custo_total)
+        FROM entradas_todas WHERE data >= ? AND data < ? GROUP BY codigo_produto
+        UNION ALL
+        SELECT codigo_produto, 0, SUM(quantidade), 0
+        FROM saidas_todas WHERE data >= ? AND data < ? GROUP BY codigo_produto
+    ) m
+    GROUP BY codigo
+"""
+
+def _gerar_snapshots(cursor, ate_mes):
+    """Fotografa os meses que faltam até `ate_mes` (na transação do cursor)"""
+    cursor.execute("SELECT MAX(mes) FROM snapshots_estoque")
+    ultimo = cursor.fetchone()[0]
+    if ultimo is None:
+        cursor.execute("""
+            SELECT MIN(d) FROM (SELECT MIN(data) AS d FROM entradas_todas
+                                UNION ALL SELECT MIN(data) FROM saidas_todas) m
+        """)
+        primeira = cursor.fetchone()[0]
+        if primeira is None:
+            return 0
+        mes = str(primeira)[:7]
+    else:
+        mes = _mes_seguinte(ultimo)
+
+    gerados = 0
+    while mes <= ate_mes:
+        inicio, fim = f"{mes}-01", f"{_mes_seguinte(mes)}-01"
+        cursor.execute(f"""
+            INSERT INTO estoque_mensal (mes, codigo, qtd_entradas, qtd_saidas, custo_total_entradas)
+            SELECT ?, codigo, qtd_entradas, qtd_saidas, custo_total_entradas FROM ({_SQL_ACUMULADO})
+        """, (mes, _mes_anterior(mes), inicio, fim, inicio, fim))
+        cursor.execute("INSERT INTO snapshots_estoque (mes) VALUES (?)", (mes,))
+        mes = _mes_seguinte(mes)
+        gerados += 1
+    return gerados
+
+def gerar_snapshots(ate_mes=None):
+    """Gera as fotografias pendentes até o mês anterior (fechamento mensal)"""
+    if ate_mes is None:
+        ate_mes = _mes_anterior(str(datetime.now().date())[:7])
+    with transacao() as cursor:
+        return _gerar_snapshots(cursor, ate_mes)
+
+@medido()
+def calcular_estoque_em(data, metodo="media"):
+    """Estoque e valor por produto no fim do dia `data` (mesmas colunas de
+    calcular_estoque_atual). Lê uma fotografia mensal e só as movimentações
+    do mês da data; no PEPS, as entradas até a data.
+    """
+    mes_base = _mes_anterior(str(data)[:7])
+    inicio, fim = f"{str(data)[:7]}-01", str(data + timedelta(days=1))
+
+    def carregar(conn):
+        gerar_snapshots(mes_base)
+        df = ler_sql(conn, f"""
+            SELECT p.*,
+                   COALESCE(a.qtd_entradas, 0) AS qtd_entradas,
+                   COALESCE(a.qtd_saidas, 0) AS qtd_saidas,
+                   COALESCE(p.estoque_inicial, 0) + COALESCE(a.qtd_entradas, 0)
+                       - COALESCE(a.qtd_saidas, 0) AS estoque_atual,
+                   COALESCE(a.custo_total_entradas, 0) AS custo_total_entradas
+            FROM produtos p
+            LEFT JOIN ({_SQL_ACUMULADO}) a ON a.codigo = p.codigo
+            ORDER BY p.codigo
+        """, (mes_base, inicio, fim, inicio, fim))
+
+        entradas = None
+        if metodo == "fifo":
+            entradas = ler_sql(
+                conn, "SELECT id, data, codigo_produto, quantidade, custo_unitario FROM entradas_todas WHERE data < ?",
+                (fim,)
+            )
+
+        with medir("valorizar_estoque", metodo=metodo):
+            df = valorizar_estoque(df, metodo=metodo, entradas=entradas)
+        return df.drop(columns=["custo_total_entradas"])
+
+    return _consultar_em_cache(("estoque_em", str(data), metodo),
+                               ("produtos", "entradas", "saidas"), carregar)
+
+# ==============================
+# ARQUIVO MENSAL
+# ==============================
+# Meses fechados saem de entradas/saídas/gastos para {tabela}_arquivo, com
+# os mesmos ids. Estoque, fotografias mensais e resumos diários não mudam
+# (são totais, não dependem de onde a linha está); o que relê movimentos
+# antigos usa a visão {tabela}_todas. Cada mês arquivado deixa uma linha
+# por tabela em meses_arquivados com os totais movidos.
+def _colunas_arquivo(cursor, tabela):
+    return ", ".join(nome for nome, _ in BACKEND.colunas(cursor, f"{tabela}_arquivo"))
+
+def arquivar_meses(ate_mes):
+    """Move os movimentos até o fim de `ate_mes` (AAAA-MM) para o arquivo.
+
+    Só meses anteriores ao atual. Lançamentos retroativos em um mês já
+    arquivado ficam na tabela quente até o próximo arquivamento, que os
+    soma ao resumo do mês. Devolve {tabela: linhas movidas}.
+    """
+    if ate_mes >= str(datetime.now().date())[:7]:
+        raise ValueError(f"Só meses fechados podem ser arquivados: {ate_mes}")
+    limite = f"{_mes_seguinte(ate_mes)}-01"
+    movidos = {}
+    with transacao() as cursor:
+        for tabela in TABELAS_ARQUIVAVEIS:
+            quantidade = "0" if tabela == "gastos" else "quantidade"
+            cursor.execute(f"""
+                INSERT INTO meses_arquivados (mes, tabela, registros, quantidade, valor)
+                SELECT {BACKEND.mes("data")}, ?, COUNT(*), SUM({quantidade}), SUM({resumos.COLUNAS_VALOR[tabela]})
+                FROM {tabela} WHERE data < ?
+                GROUP BY 1
+                ON CONFLICT (mes, tabela) DO UPDATE SET
+                    registros = meses_arquivados.registros + excluded.registros,
+                    quantidade = meses_arquivados.quantidade + excluded.quantidade,
+                    valor = meses_arquivados.valor + excluded.valor
+            """, (tabela, limite))
+            # Marca o mês mesmo sem movimento: o período quente começa depois dele
+            cursor.execute("""
+                INSERT INTO meses_arquivados (mes, tabela) VALUES (?, ?)
+                ON CONFLICT (mes, tabela) DO NOTHING
+            """, (ate_mes, tabela))
+
+            colunas = _colunas_arquivo(cursor, tabela)
+            cursor.execute(f"""
+                INSERT INTO {tabela}_arquivo ({colunas})
+                SELECT {colunas} FROM {tabela} WHERE data < ?
+            """, (limite,))
+            cursor.execute(f"DELETE FROM {tabela} WHERE data < ?", (limite,))
+            movidos[tabela] = cursor.rowcount
+        _incrementar_versao(cursor, *TABELAS_ARQUIVAVEIS, "arquivo")
+    return movidos
+
+def conferir_arquivo(tolerancia=1e-6):
+    """Compara meses_arquivados com as linhas do arquivo.
+
+    Retorna as divergências (mes, tabela, coluna, resumo, arquivo).
+    """
+    divergencias = []
+    with conexao() as conn:
+        cursor = conn.cursor()
+        for tabela in TABELAS_ARQUIVAVEIS:
+            quantidade = "0" if tabela == "gastos" else "quantidade"
+            cursor.execute(f"""
+                SELECT {BACKEND.mes("data")}, COUNT(*), SUM({quantidade}), SUM({resumos.COLUNAS_VALOR[tabela]})
+                FROM {tabela}_arquivo GROUP BY 1
+            """)
+            arquivo = {row[0]: row[1:] for row in cursor.fetchall()}
+            cursor.execute("SELECT mes, registros, quantidade, valor FROM meses_arquivados WHERE tabela = ?",
+                           (tabela,))
+            resumo = {row[0]: row[1:] for row in cursor.fetchall()}
+            for mes in sorted(set(arquivo) | set(resumo)):
+                valores_res = resumo.get(mes, (0, 0, 0))
+                valores_arq = arquivo.get(mes, (0, 0, 0))
+                for coluna, v_res, v_arq in zip(["registros", "quantidade", "valor"], valores_res, valores_arq):
+                    if abs((v_res or 0) - (v_arq or 0)) > tolerancia:
+                        divergencias.append((mes, tabela, coluna, v_res, v_arq))
+    return divergencias
+
+# ==============================
+# LINHA DE COMANDO
+# ==============================
+if __name__ == "__main__":
+    # python banco.py migrar
+    # python banco.py reconstruir-estoque [--verificar]
+    # python banco.py reconstruir-resumos
+    # python banco.py gerar-snapshots
+    # python banco.py arquivar AAAA-MM
+    # python banco.py conferir-arquivo
+    if len(sys.argv) > 1 and sys.argv[1] == "reconstruir-estoque":
+        init_database()
+        apenas_verificar = "--verificar" in sys.argv[2:]
+        divergencias = reconstruir_estoque(apenas_verificar=apenas_verificar)
+        for codigo, coluna, gravado, esperado in divergencias:
+            print(f"{codigo}: {coluna} gravado={gravado} esperado={esperado}")
+        print(f"{len(divergencias)} divergência(s) encontrada(s)"
+              + ("" if apenas_verificar else "; tabela de estoque reconstruída"))
+        sys.exit(1 if divergencias and apenas_verificar else 0)
+    if len(sys.argv) > 1 and sys.argv[1] == "reconstruir-resumos":
+        init_database()
+        reconstruir_resumos()
+        print("Resumos diários reconstruídos")
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "gerar-snapshots":
+        init_database()
+        print(f"{gerar_snapshots()} fotografia(s) mensal(is) gerada(s)")
+        sys.exit(0)
+    if len(sys.argv) == 3 and sys.argv[1] == "arquivar":
+        init_database()
+        movidos = arquivar_meses(sys.argv[2])
+        print(", ".join(f"{tabela}: {linhas}" for tabela, linhas in movidos.items())
+              + f" linha(s) arquivada(s) até {sys.argv[2]}")
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "conferir-arquivo":
+        init_database()
+        divergencias = conferir_arquivo()
+        for mes, tabela, coluna, resumo, arquivo in divergencias:
+            print(f"{mes} {tabela}: {coluna} resumo={resumo} arquivo={arquivo}")
+        print(f"{len(divergencias)} divergência(s) encontrada(s)")
+        sys.exit(1 if divergencias else 0)
+    if len(sys.argv) > 1 and sys.argv[1] == "migrar":
+        aplicadas = migrar()
+        with conexao() as conn:
+            versao = versao_schema(conn.cursor())
+        print(f"Schema na versão {versao}"
+              + (f" (aplicadas: {', '.join(map(str, aplicadas))})" if aplicadas else ""))
+        sys.exit(0)
+    print("Uso: python banco.py migrar | reconstruir-estoque [--verificar] | reconstruir-resumos"
+          " | gerar-snapshots | arquivar AAAA-MM | conferir-arquivo")
+    sys.exit(2)
@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# ==============================
+# BENCHMARK SINTÉTICO
+# ==============================
+# Gera um controle.db de rascunho com N produtos e M/K movimentos espalhados
+# por alguns anos e mede as funções de banco.py e os cálculos das páginas,
+# sem servidor Streamlit. O resultado sai em JSON para comparar versões:
+#
+#   python benchmark.py --saida antes.json
+#   python benchmark.py --saida depois.json --comparar antes.json
+#
+# banco.py lê DATABASE_URL ao ser importado, por isso os módulos do projeto
+# só são importados em executar(), depois de apontar para o banco de rascunho.
+VERSAO_FORMATO = 1
+TAMANHO_GERACAO = 100_000   # linhas geradas/inseridas por vez
+
+
+def _datas(rng, quantidade, anos, hoje):
+    dias = rng.integers(0, anos * 365, quantidade)
+    inicio = np.datetime64(hoje) - np.timedelta64(anos * 365, "D")
+    return (inicio + dias.astype("timedelta64[D]")).astype(str)
+
+
+def _notas(rng, quantidade, proporcao_com_nota=0.6):
+    numeros = rng.integers(1000, 999999, quantidade).astype(str)
+    return np.where(rng.random(quantidade) < proporcao_com_nota, numeros, "SEM NOTA")
+
+
+def gerar_produtos(rng, quantidade, unidades):
+    codigos = [f"B{i:06d}" for i in range(1, quantidade + 1)]
+    precos = rng.uniform(5, 500, quantidade).round(2)
+    return pd.DataFrame({
+        "codigo": codigos,
+        "descricao": [f"Produto sintético {c}" for c in codigos],
+        "unidade": rng.choice(unidades, quantidade),
+        "preco_sugerido": precos,
+        "estoque_minimo": rng.integers(0, 50, quantidade).astype(float),
+        "estoque_inicial": rng.integers(0, 200, quantidade).astype(float),
+    })
+
+
+def gerar_movimentos(rng, tabela, quantidade, produtos, anos, hoje, formas_pagamento):
+    """DataFrame com as colunas de COLUNAS_INSERCAO[tabela] (entradas ou saídas)"""
+    # Alguns produtos vendem muito mais que outros, como na vida real
+    pesos = rng.pareto(1.5, len(produtos)) + 1
+    indices = rng.choice(len(produtos), quantidade, p=pesos / pesos.sum())
+    preco = produtos["preco_sugerido"].to_numpy()[indices]
+    qtd = rng.integers(1, 100, quantidade).astype(float)
+
+    if tabela == "entradas":
+        unitario = (preco * rng.uniform(0.5, 0.8, quantidade)).round(2)
+        pessoa = "fornecedor"
+        col_unitario, col_total = "custo_unitario", "custo_total"
+    else:
+        qtd = np.ceil(qtd / 2)
+        unitario = (preco * rng.uniform(0.95, 1.1, quantidade)).round(2)
+        pessoa = "cliente"
+        col_unitario, col_total = "preco_unitario", "total_venda"
+
+    return pd.DataFrame({
+        "data": _datas(rng, quantidade, anos, hoje),
+        "codigo_produto": produtos["codigo"].to_numpy()[indices],
+        "descricao_produto": produtos["descricao"].to_numpy()[indices],
+        "unidade": produtos["unidade"].to_numpy()[indices],
+        "quantidade": qtd,
+        pessoa: np.char.add(f"{pessoa.capitalize()} ", rng.integers(1, 200, quantidade).astype(str)),
+        col_unitario: unitario,
+        col_total: (qtd * unitario).round(2),
+        "nota_fiscal": _notas(rng, quantidade),
+        "forma_pagamento": rng.choice(formas_pagamento, quantidade),
+        "observacoes": None,
+        "usuario_registro": "benchmark",
+    })
+
+
+def gerar_gastos(rng, quantidade, anos, hoje, categorias, formas_pagamento):
+    return pd.DataFrame({
+        "data": _datas(rng, quantidade, anos, hoje),
+        "categoria": rng.choice(categorias, quantidade),
+        "descricao": "Gasto sintético",
+        "fornecedor_beneficiario": np.char.add("Fornecedor ", rng.integers(1, 50, quantidade).astype(str)),
+        "valor": rng.uniform(10, 5000, quantidade).round(2),
+        "forma_pagamento": rng.choice(formas_pagamento, quantidade),
+        "observacoes": None,
+        "usuario_registro": "benchmark",
+    })
+
+
+def _linhas(df):
+    df = df.astype(object)
+    return list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+# ==============================
+# MEDIÇÃO
+# ==============================
+def medir(nome, funcao, repeticoes, limpar_cache=None):
+    """Executa `funcao` algumas vezes e devolve os tempos em segundos.
+
+    limpar_cache: chamado antes de cada repetição (medição a frio).
+    """
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        if limpar_cache is not None:
+            limpar_cache()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    linhas = len(resultado) if isinstance(resultado, (pd.DataFrame, pd.Series, list)) else None
+    return {
+        "nome": nome,
+        "repeticoes": repeticoes,
+        "linhas": linhas,
+        "min_s": min(tempos),
+        "mediana_s": statistics.median(tempos),
+        "media_s": statistics.fmean(tempos),
+        "max_s": max(tempos),
+    }
+
+
+def _commit_atual():
+    try:
+        saida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                               text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return saida.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def executar(args):
+    """Gera os dados, roda as medições e devolve o relatório (dict)"""
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("PERFIL_LOG", "")     # sem log de spans durante as medições
+
+    import banco
+    from cache import CACHE
+    from exportacao import exportar
+
+    rng = np.random.default_rng(args.semente)
+    hoje = date.today()
+    banco.init_database()
+
+    # ---------- geração (as inserções em lote também são medidas) ----------
+    resultados = []
+    produtos = gerar_produtos(rng, args.produtos, banco.UNIDADES)
+    resultados.append(medir("inserir_lote_produtos", lambda: banco.inserir_lote("produtos", _linhas(produtos)), 1))
+
+    for tabela, quantidade in [("entradas", args.entradas), ("saidas", args.saidas), ("gastos", args.gastos)]:
+        tempo = 0.0
+        for inicio in range(0, quantidade, TAMANHO_GERACAO):
+            parte = min(TAMANHO_GERACAO, quantidade - inicio)
+            if tabela == "gastos":
+                df = gerar_gastos(rng, parte, args.anos, hoje, banco.CATEGORIAS_GASTO, banco.FORMAS_PAGAMENTO)
+            else:
+                df = gerar_movimentos(rng, tabela, parte, produtos, args.anos, hoje, banco.FORMAS_PAGAMENTO)
+            linhas = _linhas(df)
+            inicio_lote = time.perf_counter()
+            banco.inserir_lote(tabela, linhas)
+            tempo += time.perf_counter() - inicio_lote
+        resultados.append({"nome": f"inserir_lote_{tabela}", "repeticoes": 1, "linhas": quantidade,
+                           "min_s": tempo, "mediana_s": tempo, "media_s": tempo, "max_s": tempo})
+
+    # ---------- consultas ----------
+    mes = (hoje.replace(day=1), hoje)
+    ano = (hoje - timedelta(days=365), hoje)
+    inicio_historico = hoje - timedelta(days=args.anos * 365)
+
+    def classificar_notas():
+        # Totais com/sem nota das entradas do ano pela coluna gravada
+        df = banco.carregar_entradas(*ano)
+        return df.groupby("com_nota")["custo_total"].sum()
+
+    def totais_com_sem_nota():
+        # Como o Dashboard e a aba Compras e Vendas: a partir dos resumos diários
+        resumo = banco.carregar_resumo_periodo(*ano)
+        return resumo.groupby(["tabela", "com_nota"])["valor"].sum()
+
+    consultas = [
+        ("carregar_entradas", banco.carregar_entradas),
+        ("carregar_saidas", banco.carregar_saidas),
+        ("carregar_gastos", banco.carregar_gastos),
+        ("carregar_produtos", banco.carregar_produtos),
+        ("buscar_produtos_prefixo", lambda: banco.buscar_produtos(produtos["codigo"].iloc[-1][:3])),
+        ("buscar_produtos_descricao", lambda: banco.buscar_produtos(produtos["descricao"].iloc[-1].split()[0])),
+        ("produtos_por_codigo", banco.produtos_por_codigo),
+        ("calcular_estoque_atual_media", lambda: banco.calcular_estoque_atual("media")),
+        ("calcular_estoque_atual_fifo", lambda: banco.calcular_estoque_atual("fifo")),
+        ("estoque_em_meio_do_ano", lambda: banco.calcular_estoque_em(hoje - timedelta(days=180))),
+        ("periodo_mes_entradas", lambda: banco.carregar_entradas(*mes)),
+        ("periodo_mes_saidas", lambda: banco.carregar_saidas(*mes)),
+        ("periodo_ano_saidas", lambda: banco.carregar_saidas(*ano)),
+        ("periodo_ano_gastos", lambda: banco.carregar_gastos(*ano)),
+        ("periodo_ano_saidas_colunas", lambda: banco.carregar_saidas(
+            *ano, colunas=["data", "codigo_produto", "cliente", "total_venda"])),
+        ("gastos_por_categoria_ano", lambda: banco.carregar_gastos(
+            *ano, colunas=["categoria", "valor"]).groupby("categoria", observed=True)["valor"].sum()),
+        ("resumo_categorias_ano", lambda: banco.carregar_resumo_categorias(*ano)),
+        ("resumo_periodo_ano", lambda: banco.carregar_resumo_periodo(*ano)),
+        ("serie_temporal_ano", lambda: banco.carregar_serie_temporal(*ano)),
+        ("serie_temporal_historico", lambda: banco.carregar_serie_temporal(inicio_historico, hoje)),
+        ("resumo_produtos_ano_entradas", lambda: banco.carregar_resumo_produtos("entradas", *ano)),
+        ("historico_primeira_pagina", lambda: banco.carregar_historico("saidas")[0]),
+        ("com_sem_nota_coluna", classificar_notas),
+        ("com_sem_nota_resumos", totais_com_sem_nota),
+        ("ranking_receita_ano", lambda: banco.carregar_ranking_produtos(*ano, criterio="receita")),
+        ("ranking_margem_ano", lambda: banco.carregar_ranking_produtos(*ano, criterio="margem")),
+        ("vendas_por_mes_produto", lambda: banco.carregar_vendas_por_mes(produtos["codigo"].iloc[0], *ano)),
+        ("vendas_por_cliente_produto", lambda: banco.carregar_vendas_por_cliente(produtos["codigo"].iloc[0], *ano)),
+    ]
+    for nome, funcao in consultas:
+        resultado = medir(nome, funcao, args.repeticoes, limpar_cache=CACHE.limpar)
+        resultado["cache"] = "frio"
+        resultados.append(resultado)
+        resultado = medir(nome, funcao, args.repeticoes)
+        resultado["cache"] = "quente"
+        resultados.append(resultado)
+
+    # ---------- exportação (pesada: uma repetição) ----------
+    pasta = tempfile.mkdtemp(prefix="benchmark_export_")
+    try:
+        for formato in ["xlsx", "csv"]:
+            destino = os.path.join(pasta, f"export.{formato}")
+            resultado = medir(f"exportar_{formato}", lambda: exportar(formato, destino), 1,
+                              limpar_cache=CACHE.limpar)
+            resultado["bytes"] = os.path.getsize(destino)
+            resultados.append(resultado)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    return {
+        "versao_formato": VERSAO_FORMATO,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "banco": banco.BACKEND.nome,
+            "plataforma": platform.platform(),
+        },
+        "parametros": {
+            "produtos": args.produtos, "entradas": args.entradas, "saidas": args.saidas,
+            "gastos": args.gastos, "anos": args.anos, "repeticoes": args.repeticoes,
+            "semente": args.semente,
+        },
+        "resultados": resultados,
+    }
+
+
+def _chave(resultado):
+    return resultado["nome"], resultado.get("cache")
+
+
+def comparar(atual, anterior, limite=1.25, folga_s=0.001):
+    """Linhas de texto com a razão atual/anterior e o número de regressões.
+
+    Compara os tempos mínimos, menos sensíveis a ruído que a média; diferenças
+    abaixo de `folga_s` não contam como regressão.
+    """
+    anteriores = {_chave(r): r for r in anterior["resultados"]}
+    linhas = []
+    regressoes = 0
+    for r in atual["resultados"]:
+        antes = anteriores.get(_chave(r))
+        if antes is None or antes["min_s"] <= 0:
+            continue
+        razao = r["min_s"] / antes["min_s"]
+        regrediu = razao > limite and r["min_s"] - antes["min_s"] > folga_s
+        regressoes += regrediu
+        nome = r["nome"] + (f" ({r['cache']})" if r.get("cache") else "")
+        linhas.append(f"{nome:45} {antes['min_s'] * 1000:10.2f} ms -> {r['min_s'] * 1000:10.2f} ms"
+                      f"  x{razao:.2f}{'  <-- regressão' if regrediu else ''}")
+    return linhas, regressoes
+
+
+# ==============================
+# LINHA DE COMANDO
+# ==============================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark com dados sintéticos (sem Streamlit)")
+    parser.add_argument("--produtos", type=int, default=500)
+    parser.add_argument("--entradas", type=int, default=50_000)
+    parser.add_argument("--saidas", type=int, default=100_000)
+    parser.add_argument("--gastos", type=int, default=10_000)
+    parser.add_argument("--anos", type=int, default=3, help="anos de histórico até hoje")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--db", help="arquivo do banco de rascunho (padrão: pasta temporária) "
+                                     "ou URL postgresql:// de um banco vazio")
+    parser.add_argument("--manter", action="store_true", help="não apaga o banco de rascunho no fim")
+    parser.add_argument("--saida", help="grava o JSON neste arquivo (padrão: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--limite", type=float, default=1.25,
+                        help="razão atual/anterior a partir da qual um tempo é regressão")
+    args = parser.parse_args()
+
+    pasta_rascunho = None
+    if args.db is None:
+        pasta_rascunho = tempfile.mkdtemp(prefix="benchmark_")
+        args.db = os.path.join(pasta_rascunho, "controle.db")
+    elif os.path.exists(args.db):
+        print(f"{args.db} já existe; use um arquivo novo para não misturar dados", file=sys.stderr)
+        sys.exit(2)
+
+    try:
+        relatorio = executar(args)
+    finally:
+        if pasta_rascunho and args.manter:
+            print(f"Banco de rascunho mantido em {args.db}", file=sys.stderr)
+        elif pasta_rascunho:
+            shutil.rmtree(pasta_rascunho, ignore_errors=True)
+
+    texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arq:
+            arq.write(texto)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arq:
+            linhas, regressoes = comparar(relatorio, json.load(arq), args.limite)
+        print("\n".join(linhas), file=sys.stderr)
+        sys.exit(1 if regressoes else 0)
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+import os
+import sys
+
+import pandas as pd
+
+# ==============================
+# CACHE DE CONSULTAS
+# ==============================
+# O módulo é importado uma vez por processo, então o cache sobrevive aos
+# reruns do Streamlit e é compartilhado entre as sessões.
+CACHE_MAX_MB = float(os.environ.get("CACHE_MAX_MB", "256"))
+CACHE_MAX_ITENS = int(os.environ.get("CACHE_MAX_ITENS", "128"))
+
+# Devolvido por obter() quando não há item válido; None é um valor que
+# pode ficar em cache (ex.: figura de um período sem movimentos)
+AUSENTE = object()
+
+
+def tamanho_em_bytes(valor):
+    """Tamanho aproximado de um resultado em memória"""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(k) + tamanho_em_bytes(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(item) for item in valor)
+    if hasattr(valor, "to_plotly_json"):
+        # Figuras do Plotly: pelo tamanho do JSON serializado
+        return len(valor.to_json())
+    return sys.getsizeof(valor)
+
+
+class CacheConsultas:
+    """Cache LRU de resultados, válido enquanto as versões das tabelas não mudam.
+
+    Cada item guarda as versões das tabelas de que depende; se alguma foi
+    incrementada por uma escrita, o item é descartado na próxima leitura.
+    Os DataFrames devolvidos são compartilhados: não devem ser alterados.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_MB * 1024 * 1024, max_itens=CACHE_MAX_ITENS):
+        self.max_bytes = max_bytes
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.descartes = 0
+
+    def obter(self, chave, versoes):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] != versoes:
+                self.misses += 1
+                return AUSENTE
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def guardar(self, chave, versoes, valor):
+        tamanho = tamanho_em_bytes(valor)
+        with self._lock:
+            self._remover(chave)
+            if tamanho > self.max_bytes:
+                return
+            self._itens[chave] = (versoes, valor, tamanho)
+            self.bytes += tamanho
+            while self._itens and (self.bytes > self.max_bytes or len(self._itens) > self.max_itens):
+                self._remover(next(iter(self._itens)))
+                self.descartes += 1
+
+    def _remover(self, chave):
+        item = self._itens.pop(chave, None)
+        if item is not None:
+            self.bytes -= item[2]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self.bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self._itens),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "descartes": self.descartes,
+                "taxa_acerto": self.hits / total if total else 0.0
+            }
+
+
+CACHE = CacheConsultas()
@@ -0,0 +1,393 @@
+import csv
+import io
+import os
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+# ==============================
+# CONFIGURAÇÃO
+# ==============================
+DB_FILE = "controle.db"
+DATABASE_URL = os.environ.get("DATABASE_URL", DB_FILE)
+USE_POSTGRES = DATABASE_URL.startswith("postgres")
+
+# Conexões mantidas abertas e reutilizadas pelo processo
+POOL_TAMANHO = int(os.environ.get("DB_POOL_TAMANHO", "8"))
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",          # leitores não bloqueiam durante escritas
+    "synchronous": "NORMAL",        # seguro com WAL e bem mais rápido que FULL
+    "cache_size": -32000,           # 32 MB de cache de páginas por conexão
+    "mmap_size": 268435456,         # 256 MB mapeados em memória
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+}
+
+# ==============================
+# BACKENDS
+# ==============================
+# O resto do código escreve SQL com marcadores "?" e usa conexões no estilo
+# DB-API (conn.execute, cursor.execute/executemany/fetch*). Cada backend
+# entrega conexões assim e concentra o que muda de um banco para outro:
+# expressões de data, tipos das colunas, carga em lote e leitura em lotes.
+# O SQLite é o padrão; DATABASE_URL=postgresql://... usa o PostgreSQL.
+
+
+class PoolConexoes:
+    """Pool de conexões persistentes compartilhado por todas as sessões.
+
+    Cada operação pega uma conexão livre e a devolve no fim; as conexões
+    (e seus statements preparados) vivem enquanto o processo viver.
+    """
+
+    def __init__(self, conectar, tamanho=POOL_TAMANHO):
+        self._conectar = conectar
+        self._livres = queue.LifoQueue(maxsize=tamanho)
+
+    @contextmanager
+    def conexao(self):
+        try:
+            conn = self._livres.get_nowait()
+        except queue.Empty:
+            conn = self._conectar()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._livres.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+class BackendSQLite:
+    nome = "sqlite"
+    like = "LIKE"                   # já ignora maiúsculas/minúsculas (ASCII)
+    fts = True                      # FTS5, se o SQLite foi compilado com ele
+    erros_integridade = (sqlite3.IntegrityError,)
+
+    # Início de cada intervalo das séries temporais (texto AAAA-MM-DD)
+    intervalos = {
+        "dia": "date(data)",
+        "semana": "date(data, '-6 days', 'weekday 1')",
+        "mes": "strftime('%Y-%m-01', data)",
+        "ano": "strftime('%Y-01-01', data)",
+    }
+
+    def __init__(self, url):
+        self.url = url
+        self._pool = PoolConexoes(self.conectar)
+
+    def conectar(self):
+        conn = sqlite3.connect(
+            self.url,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            isolation_level=None,       # transações explícitas em transacao()
+            cached_statements=256       # statements preparados reaproveitados
+        )
+        for pragma, valor in SQLITE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {valor}")
+        return conn
+
+    def conexao(self):
+        return self._pool.conexao()
+
+    def iniciar_transacao(self, cursor):
+        # BEGIN IMMEDIATE reserva a escrita logo no início
+        cursor.execute("BEGIN IMMEDIATE")
+
+    # Expressões SQL
+    def dia(self, coluna):
+        return f"date({coluna})"
+
+    def mes(self, coluna):
+        """Texto AAAA-MM da data"""
+        return f"substr({coluna}, 1, 7)"
+
+    def e_texto(self, coluna):
+        return f"typeof({coluna}) = 'text'"
+
+    # Catálogo
+    def colunas(self, cursor, tabela):
+        """[(nome, tipo declarado)] na ordem da tabela"""
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        return [(col[1], col[2].upper()) for col in cursor.fetchall()]
+
+    def tabela_existe(self, cursor, nome):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (nome,))
+        return cursor.fetchone() is not None
+
+    # Dados em lote
+    def copiar(self, cursor, tabela, colunas, linhas, tamanho_lote=1000):
+        """INSERT de muitas linhas: executemany em lotes de `tamanho_lote`"""
+        sql = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' for _ in colunas)})"
+        for inicio in range(0, len(linhas), tamanho_lote):
+            cursor.executemany(sql, linhas[inicio:inicio + tamanho_lote])
+
+    def ler_em_lotes(self, conn, sql, params, tamanho):
+        cursor = conn.execute(sql, params)
+        colunas = [col[0] for col in cursor.description]
+        while True:
+            linhas = cursor.fetchmany(tamanho)
+            yield colunas, linhas
+            if len(linhas) < tamanho:
+                break
+
+
+# Tipos do SQLite nos CREATE/ALTER que o PostgreSQL escreve de outro jeito
+_DDL_POSTGRES = [
+    (re.compile(r"\bINTEGER PRIMARY KEY AUTOINCREMENT\b", re.I), "SERIAL PRIMARY KEY"),
+    (re.compile(r"\bREAL\b", re.I), "DOUBLE PRECISION"),
+    (re.compile(r"\bCREATE VIEW IF NOT EXISTS\b", re.I), "CREATE OR REPLACE VIEW"),
+]
+_LITERAIS = re.compile(r"('(?:[^']|'')*')")
+
+
+@lru_cache(maxsize=1024)
+def traduzir_postgres(sql):
+    """SQL com marcadores "?" -> psycopg2 ("%s", "%" literal dobrado)"""
+    partes = _LITERAIS.split(sql)
+    for i, parte in enumerate(partes):
+        parte = parte.replace("%", "%%")
+        partes[i] = parte if i % 2 else parte.replace("?", "%s")
+    sql = "".join(partes)
+    if sql.lstrip().upper().startswith(("CREATE", "ALTER")):
+        for padrao, troca in _DDL_POSTGRES:
+            sql = padrao.sub(troca, sql)
+    return sql
+
+
+class CursorPostgres:
+    """Cursor psycopg2 que aceita o SQL escrito para o SQLite"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(traduzir_postgres(sql), tuple(params))
+        return self
+
+    def executemany(self, sql, seq_params):
+        from psycopg2.extras import execute_batch
+        # Vários comandos por ida ao servidor, em vez de um por linha
+        execute_batch(self._cursor, traduzir_postgres(sql), [tuple(p) for p in seq_params], page_size=500)
+        return self
+
+    def copy_expert(self, sql, arquivo):
+        self._cursor.copy_expert(sql, arquivo)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, tamanho):
+        return self._cursor.fetchmany(tamanho)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoPostgres:
+    """Conexão psycopg2 em autocommit, com transações abertas por BEGIN
+    (como o SQLite com isolation_level=None).
+
+    `bruta` é a conexão do pool do engine: close() a devolve ao pool.
+    """
+
+    def __init__(self, conn, bruta=None):
+        self._conn = conn
+        self._bruta = bruta
+
+    def cursor(self):
+        return CursorPostgres(self._conn.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    @property
+    def in_transaction(self):
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+        return self._conn.info.transaction_status != TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        if self.in_transaction:
+            self._conn.cursor().execute("COMMIT")
+
+    def rollback(self):
+        if self.in_transaction:
+            self._conn.cursor().execute("ROLLBACK")
+
+    def close(self):
+        (self._bruta or self._conn).close()
+
+
+class BackendPostgres:
+    nome = "postgres"
+    like = "ILIKE"
+    fts = False                     # busca de produtos por ILIKE
+    # Chave do pg_advisory_xact_lock que serializa as transações de escrita
+    TRAVA_ESCRITA = 751_001
+
+    intervalos = {
+        "dia": "CAST(data AS DATE)",
+        "semana": "CAST(date_trunc('week', data) AS DATE)",
+        "mes": "CAST(date_trunc('month', data) AS DATE)",
+        "ano": "CAST(date_trunc('year', data) AS DATE)",
+    }
+
+    def __init__(self, url):
+        # SQLAlchemy só aceita o esquema postgresql://
+        self.url = re.sub(r"^postgres(ql)?(\+\w+)?://", "postgresql+psycopg2://", url)
+        self._engine = None
+        self._lock = threading.Lock()
+        from psycopg2 import IntegrityError
+        self.erros_integridade = (IntegrityError,)
+
+    def engine(self):
+        """Um engine (e um pool) por processo, criado no primeiro uso"""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    from sqlalchemy import create_engine
+                    self._engine = create_engine(
+                        self.url, pool_size=POOL_TAMANHO, max_overflow=POOL_TAMANHO,
+                        pool_pre_ping=True,       # descarta conexões derrubadas pelo servidor
+                    )
+        return self._engine
+
+    def conectar(self):
+        """Conexão do pool do engine; close() a devolve ao pool"""
+        bruta = self.engine().raw_connection()
+        driver = bruta.driver_connection
+        driver.autocommit = True
+        return ConexaoPostgres(driver, bruta)
+
+    @contextmanager
+    def conexao(self):
+        conn = self.conectar()
+        try:
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            finally:
+                conn.close()              # devolve ao pool do engine
+
+    def iniciar_transacao(self, cursor):
+        # Como o BEGIN IMMEDIATE do SQLite: uma escrita por vez, então as
+        # leituras feitas dentro da transação já enxergam o estado final
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT pg_advisory_xact_lock(?)", (self.TRAVA_ESCRITA,))
+
+    # Expressões SQL
+    def dia(self, coluna):
+        return f"CAST({coluna} AS DATE)"
+
+    def mes(self, coluna):
+        return f"to_char({coluna}, 'YYYY-MM')"
+
+    def e_texto(self, coluna):
+        return f"{coluna} IS NOT NULL"
+
+    # Catálogo
+    def colunas(self, cursor, tabela):
+        cursor.execute("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+            ORDER BY ordinal_position
+        """, (tabela,))
+        return [(nome, tipo.upper()) for nome, tipo in cursor.fetchall()]
+
+    def tabela_existe(self, cursor, nome):
+        cursor.execute("SELECT to_regclass(?) IS NOT NULL", (nome,))
+        return cursor.fetchone()[0]
+
+    # Dados em lote
+    def copiar(self, cursor, tabela, colunas, linhas, tamanho_lote=1000):
+        """COPY ... FROM STDIN em CSV, um bloco de `tamanho_lote` linhas por vez.
+
+        Com QUOTE_NONNUMERIC, None sai como campo vazio sem aspas (NULL) e
+        texto vazio como "" (string vazia).
+        """
+        sql = f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)"
+        for inicio in range(0, len(linhas), tamanho_lote):
+            bloco = io.StringIO()
+            csv.writer(bloco, quoting=csv.QUOTE_NONNUMERIC).writerows(linhas[inicio:inicio + tamanho_lote])
+            bloco.seek(0)
+            cursor.copy_expert(sql, bloco)
+
+    def ler_em_lotes(self, conn, sql, params, tamanho):
+        # Cursor nomeado = cursor do lado do servidor: as linhas vêm do
+        # PostgreSQL `tamanho` por vez. Ele só existe dentro de uma transação.
+        driver = conn._conn
+        driver.autocommit = False
+        cursor = driver.cursor(name=f"lotes_{id(driver)}")
+        try:
+            cursor.itersize = tamanho
+            cursor.execute(traduzir_postgres(sql), tuple(params))
+            while True:
+                linhas = cursor.fetchmany(tamanho)
+                yield [col[0] for col in cursor.description], linhas
+                if len(linhas) < tamanho:
+                    break
+        finally:
+            cursor.close()
+            driver.rollback()             # só leitura
+            driver.autocommit = True
+
+
+def criar_backend(url=DATABASE_URL):
+    return BackendPostgres(url) if url.startswith("postgres") else BackendSQLite(url)
+
+
+BACKEND = criar_backend()
+
+
+def get_connection():
+    """Abre uma nova conexão configurada (use conexao()/transacao() no dia a dia).
+
+    No PostgreSQL ela vem do pool do engine e close() a devolve.
+    """
+    return BACKEND.conectar()
+
+
+def conexao():
+    """Conexão do pool para leituras: with conexao() as conn: ..."""
+    return BACKEND.conexao()
+
+
+@contextmanager
+def transacao():
+    """Cursor em uma transação de escrita: commit no fim, rollback em erro.
+
+    A transação reserva a escrita logo no início, então as leituras
+    feitas dentro dela já enxergam o estado que será alterado.
+    """
+    with conexao() as conn:
+        cursor = conn.cursor()
+        BACKEND.iniciar_transacao(cursor)
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
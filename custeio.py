@@ -0,0 +1,66 @@
+import pandas as pd
+import numpy as np
+
+# ==============================
+# CUSTEIO DO ESTOQUE
+# ==============================
+METODOS_CUSTEIO = {"media": "Custo médio ponderado", "fifo": "PEPS (FIFO)"}
+
+
+def custo_medio(custo_total, quantidade):
+    """Custo médio ponderado (custo total / quantidade); NaN sem quantidade"""
+    custo_total = np.asarray(custo_total, dtype=float)
+    quantidade = np.asarray(quantidade, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(quantidade > 0, custo_total / quantidade, np.nan)
+
+
+def valor_fifo(entradas, estoque):
+    """Valor do estoque por PEPS: o saldo é formado pelas entradas mais recentes.
+
+    entradas: colunas codigo_produto, data, id, quantidade, custo_unitario
+    estoque: Series estoque_atual indexada por codigo
+    Retorna DataFrame com codigo, qtd_coberta e valor_fifo.
+    """
+    if entradas.empty or estoque.empty:
+        return pd.DataFrame(columns=["codigo", "qtd_coberta", "valor_fifo"])
+
+    df = entradas[["codigo_produto", "data", "id", "quantidade", "custo_unitario"]]
+    df = df[df["codigo_produto"].isin(estoque.index)]
+    df = df.sort_values(["codigo_produto", "data", "id"], ascending=[True, False, False])
+
+    # Camadas da mais nova para a mais antiga: cada uma cobre o que falta do saldo
+    saldo = df["codigo_produto"].map(estoque).clip(lower=0).to_numpy(dtype=float)
+    qtd = df["quantidade"].to_numpy(dtype=float)
+    acumulado = df.groupby("codigo_produto", sort=False)["quantidade"].cumsum().to_numpy(dtype=float)
+    coberto = np.clip(saldo - (acumulado - qtd), 0, qtd)
+
+    res = pd.DataFrame({
+        "codigo": df["codigo_produto"].to_numpy(),
+        "qtd_coberta": coberto,
+        "valor_fifo": coberto * df["custo_unitario"].to_numpy(dtype=float)
+    })
+    return res.groupby("codigo", sort=False).sum().reset_index()
+
+
+def valorizar_estoque(df, metodo="media", entradas=None):
+    """Preenche custo_medio e valor_estoque no DataFrame de estoque.
+
+    df precisa de codigo, estoque_atual, preco_sugerido, qtd_entradas e
+    custo_total_entradas. Produtos sem entradas usam o preço sugerido;
+    no PEPS o saldo não coberto por entradas vale o custo médio.
+    """
+    df = df.copy()
+    df["custo_medio"] = custo_medio(df["custo_total_entradas"], df["qtd_entradas"])
+    df["custo_medio"] = df["custo_medio"].fillna(df["preco_sugerido"])
+    df["valor_estoque"] = df["estoque_atual"] * df["custo_medio"]
+
+    if metodo == "fifo" and entradas is not None and not entradas.empty:
+        fifo = valor_fifo(entradas, df.set_index("codigo")["estoque_atual"]).set_index("codigo")
+        coberto = df["codigo"].map(fifo["qtd_coberta"]).fillna(0)
+        valor = df["codigo"].map(fifo["valor_fifo"]).fillna(0)
+        com_saldo = df["estoque_atual"] > 0
+        df.loc[com_saldo, "valor_estoque"] = (
+            valor + (df["estoque_atual"] - coberto) * df["custo_medio"]
+        )[com_saldo]
+    return df
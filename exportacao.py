@@ -0,0 +1,261 @@
+import csv
+import io
+import os
+import sys
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+
+import openpyxl
+
+from banco import (
+    init_database, ler_em_lotes, sql_movimentos, tipos_colunas, calcular_estoque_atual,
+    calcular_estoque_em, versoes_tabelas
+)
+from perfil import medir
+
+# ==============================
+# EXPORTAÇÃO
+# ==============================
+# As linhas vão do cursor para o arquivo em lotes: nenhuma tabela inteira
+# fica em memória, seja qual for o tamanho do histórico.
+TAMANHO_LOTE = 5000
+
+FORMATOS = {"xlsx": "Excel (.xlsx)", "csv": "CSV (.zip)", "parquet": "Parquet (.zip)"}
+EXTENSOES = {"xlsx": ".xlsx", "csv": ".zip", "parquet": ".zip"}
+MIME_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "application/zip",
+    "parquet": "application/zip",
+}
+
+
+def abas_exportacao(data_inicial=None, data_final=None):
+    """Abas do arquivo: (nome, tabela com os tipos das colunas, gerador de lotes).
+
+    Entradas, saídas e gastos respeitam o período, se informado; o estoque
+    é a posição no fim da data final.
+    """
+    abas = []
+    for nome, tabela in [("ENTRADAS", "entradas"), ("SAIDAS", "saidas"), ("GASTOS", "gastos")]:
+        sql, params = sql_movimentos(tabela, data_inicial, data_final)
+        abas.append((nome, tabela, lambda sql=sql, params=params: ler_em_lotes(sql, params, TAMANHO_LOTE)))
+    abas.append(("PRODUTOS", "produtos",
+                 lambda: ler_em_lotes("SELECT * FROM produtos ORDER BY codigo", (), TAMANHO_LOTE)))
+    abas.append(("ESTOQUE", "produtos", lambda: _lotes_estoque(data_final)))
+    return abas
+
+
+def _lotes_estoque(data_final=None):
+    # Uma linha por produto, já em cache: não recalcula o estoque
+    if data_final is None or data_final >= date.today():
+        df = calcular_estoque_atual()
+    else:
+        df = calcular_estoque_em(data_final)
+    colunas = list(df.columns)
+    for inicio in range(0, max(len(df), 1), TAMANHO_LOTE):
+        yield colunas, list(df.iloc[inicio:inicio + TAMANHO_LOTE].itertuples(index=False, name=None))
+
+
+def _escrever_xlsx(caminho, abas):
+    # write_only: o openpyxl grava cada linha direto no arquivo temporário da aba
+    wb = openpyxl.Workbook(write_only=True)
+    for nome, _, gerar in abas:
+        ws = wb.create_sheet(nome)
+        for i, (colunas, linhas) in enumerate(gerar()):
+            if i == 0:
+                ws.append(colunas)
+            for linha in linhas:
+                ws.append(linha)
+    wb.save(caminho)
+
+
+def _escrever_csv(caminho, abas):
+    # Um CSV por aba dentro de um .zip
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nome, _, gerar in abas:
+            with zf.open(f"{nome}.csv", "w", force_zip64=True) as bruto, \
+                    io.TextIOWrapper(bruto, encoding="utf-8-sig", newline="") as arq:
+                escritor = csv.writer(arq)
+                for i, (colunas, linhas) in enumerate(gerar()):
+                    if i == 0:
+                        escritor.writerow(colunas)
+                    escritor.writerows(linhas)
+
+
+def _schema_parquet(pa, colunas, tipos):
+    # Colunas fora da tabela (valores calculados do estoque) são numéricas
+    arrow = {"INTEGER": pa.int64(), "BIGINT": pa.int64(), "REAL": pa.float64(),
+             "DOUBLE PRECISION": pa.float64()}
+    return pa.schema([(col, arrow.get(tipos.get(col, "REAL"), pa.string())) for col in colunas])
+
+
+def _escrever_parquet(caminho, abas):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Um .parquet por aba dentro de um .zip (parquet já é comprimido)
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_STORED) as zf:
+        for nome, tabela, gerar in abas:
+            tipos = tipos_colunas(tabela)
+            with zf.open(f"{nome}.parquet", "w", force_zip64=True) as destino:
+                escritor = None
+                for colunas, linhas in gerar():
+                    if escritor is None:
+                        schema = _schema_parquet(pa, colunas, tipos)
+                        escritor = pq.ParquetWriter(destino, schema)
+                    valores = list(zip(*linhas)) if linhas else [()] * len(colunas)
+                    arrays = []
+                    for campo, vals in zip(schema, valores):
+                        if pa.types.is_string(campo.type):
+                            vals = [None if v is None else str(v) for v in vals]
+                        arrays.append(pa.array(vals, type=campo.type))
+                    escritor.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                escritor.close()
+
+
+ESCRITORES = {"xlsx": _escrever_xlsx, "csv": _escrever_csv, "parquet": _escrever_parquet}
+
+
+def nome_arquivo(formato):
+    return f"MLT_{datetime.now().strftime('%Y%m%d_%H%M')}{EXTENSOES[formato]}"
+
+
+def exportar(formato="xlsx", destino=None, data_inicial=None, data_final=None):
+    """Gera o arquivo de exportação em disco e devolve o caminho.
+
+    Sem destino, grava em um arquivo temporário (quem chama o remove).
+    """
+    if destino is None:
+        fd, destino = tempfile.mkstemp(prefix="MLT_", suffix=EXTENSOES[formato])
+        os.close(fd)
+    ESCRITORES[formato](destino, abas_exportacao(data_inicial, data_final))
+    return destino
+
+
+# ==============================
+# EXPORTAÇÃO EM SEGUNDO PLANO
+# ==============================
+# O app não gera o arquivo dentro do rerun: solicitar_exportacao() põe a
+# tarefa em um pool de threads e devolve na hora. O arquivo fica em
+# EXPORTACOES_DIR com o período e as versões das tabelas no nome, então um
+# pedido igual com os dados inalterados reaproveita o arquivo pronto.
+EXPORTACOES_DIR = os.environ.get("EXPORTACOES_DIR", "exportacoes")
+EXPORTACAO_THREADS = int(os.environ.get("EXPORTACAO_THREADS", "2"))
+
+# Tabelas cujas escritas mudam o conteúdo exportado
+TABELAS_EXPORTADAS = ("entradas", "saidas", "gastos", "produtos", "estoque")
+
+_executor = ThreadPoolExecutor(max_workers=EXPORTACAO_THREADS, thread_name_prefix="exportacao")
+_tarefas = {}
+_tarefas_lock = threading.Lock()
+
+
+class TarefaExportacao:
+    """Estado de uma exportação: na fila, gerando, pronta ou erro"""
+
+    def __init__(self, formato, data_inicial, data_final, caminho):
+        self.formato = formato
+        self.data_inicial = data_inicial
+        self.data_final = data_final
+        self.caminho = caminho
+        self.estado = "na fila"
+        self.aba = None
+        self.progresso = 0.0
+        self.erro = None
+
+    @property
+    def pronta(self):
+        return self.estado == "pronta" and os.path.exists(self.caminho)
+
+    @property
+    def terminada(self):
+        return self.estado in ("pronta", "erro")
+
+
+def _prefixo_arquivo(formato, data_inicial, data_final):
+    return f"MLT_{formato}_{data_inicial or 'inicio'}_{data_final or 'hoje'}_"
+
+
+def _com_progresso(tarefa, abas):
+    # Cada gerador de aba anota a aba atual e, ao terminar, o progresso
+    def acompanhar(i, nome, gerar):
+        tarefa.aba = nome
+        yield from gerar()
+        tarefa.progresso = (i + 1) / len(abas)
+
+    return [(nome, tabela, lambda i=i, nome=nome, gerar=gerar: acompanhar(i, nome, gerar))
+            for i, (nome, tabela, gerar) in enumerate(abas)]
+
+
+def _executar(tarefa):
+    tarefa.estado = "gerando"
+    parcial = tarefa.caminho + ".parcial"
+    try:
+        with medir("exportacao", formato=tarefa.formato):
+            abas = _com_progresso(tarefa, abas_exportacao(tarefa.data_inicial, tarefa.data_final))
+            ESCRITORES[tarefa.formato](parcial, abas)
+        os.replace(parcial, tarefa.caminho)   # nunca expõe um arquivo pela metade
+        _remover_antigos(tarefa)
+        tarefa.progresso = 1.0
+        tarefa.estado = "pronta"
+    except Exception as e:
+        tarefa.erro = str(e)
+        tarefa.estado = "erro"
+        if os.path.exists(parcial):
+            os.remove(parcial)
+
+
+def _remover_antigos(nova):
+    # Mesmo formato e período, versões anteriores dos dados
+    pasta, nome = os.path.split(nova.caminho)
+    prefixo = _prefixo_arquivo(nova.formato, nova.data_inicial, nova.data_final)
+    with _tarefas_lock:
+        for chave, tarefa in list(_tarefas.items()):
+            if tarefa is not nova and tarefa.terminada and \
+                    os.path.basename(tarefa.caminho).startswith(prefixo):
+                del _tarefas[chave]
+        for arquivo in os.listdir(pasta):
+            if arquivo.startswith(prefixo) and arquivo != nome and not arquivo.endswith(".parcial"):
+                try:
+                    os.remove(os.path.join(pasta, arquivo))
+                except OSError:
+                    pass
+
+
+def solicitar_exportacao(formato="xlsx", data_inicial=None, data_final=None):
+    """Devolve a TarefaExportacao do pedido, reaproveitando arquivo ou tarefa em andamento"""
+    versoes = versoes_tabelas(TABELAS_EXPORTADAS)
+    chave = (formato, data_inicial, data_final, versoes)
+    nome = (_prefixo_arquivo(formato, data_inicial, data_final)
+            + f"v{'-'.join(map(str, versoes))}{EXTENSOES[formato]}")
+    caminho = os.path.join(EXPORTACOES_DIR, nome)
+
+    with _tarefas_lock:
+        tarefa = _tarefas.get(chave)
+        if tarefa is not None and (tarefa.pronta or not tarefa.terminada):
+            return tarefa
+        tarefa = TarefaExportacao(formato, data_inicial, data_final, caminho)
+        _tarefas[chave] = tarefa
+        if os.path.exists(caminho):
+            # Gerado antes (talvez por outro processo) com os mesmos dados
+            tarefa.estado, tarefa.progresso = "pronta", 1.0
+            return tarefa
+        os.makedirs(EXPORTACOES_DIR, exist_ok=True)
+    _executor.submit(_executar, tarefa)
+    return tarefa
+
+
+# ==============================
+# LINHA DE COMANDO
+# ==============================
+if __name__ == "__main__":
+    # python exportacao.py FORMATO DESTINO [AAAA-MM-DD AAAA-MM-DD]
+    if len(sys.argv) not in (3, 5) or sys.argv[1] not in FORMATOS:
+        print(f"Uso: python exportacao.py {{{'|'.join(FORMATOS)}}} DESTINO [DATA_INICIAL DATA_FINAL]")
+        sys.exit(2)
+    periodo = [date.fromisoformat(d) for d in sys.argv[3:5]] or [None, None]
+    init_database()
+    print(exportar(sys.argv[1], sys.argv[2], *periodo))
@@ -0,0 +1,161 @@
+import sys
+
+import pandas as pd
+
+from banco import (
+    UNIDADES, FORMAS_PAGAMENTO, CATEGORIAS_GASTO, COLUNAS_INSERCAO,
+    init_database, carregar_produtos, inserir_lote
+)
+
+# ==============================
+# IMPORTAÇÃO EM LOTE
+# ==============================
+# Regras de cada tabela: colunas obrigatórias, números (> 0 ou >= 0) e
+# valores que precisam estar nas listas usadas nos formulários.
+ESQUEMAS = {
+    "entradas": {
+        "obrigatorias": ["data", "codigo_produto", "quantidade", "custo_unitario"],
+        "positivas": ["quantidade"],
+        "nao_negativas": ["custo_unitario", "custo_total"],
+        "listas": {"unidade": UNIDADES, "forma_pagamento": FORMAS_PAGAMENTO},
+        "total": ("custo_total", "custo_unitario"),
+    },
+    "saidas": {
+        "obrigatorias": ["data", "codigo_produto", "quantidade", "preco_unitario"],
+        "positivas": ["quantidade"],
+        "nao_negativas": ["preco_unitario", "total_venda"],
+        "listas": {"unidade": UNIDADES, "forma_pagamento": FORMAS_PAGAMENTO},
+        "total": ("total_venda", "preco_unitario"),
+    },
+    "gastos": {
+        "obrigatorias": ["data", "categoria", "valor"],
+        "positivas": [],
+        "nao_negativas": ["valor"],
+        "listas": {"categoria": CATEGORIAS_GASTO, "forma_pagamento": FORMAS_PAGAMENTO},
+    },
+    "produtos": {
+        "obrigatorias": ["codigo", "descricao", "unidade", "preco_sugerido", "estoque_minimo"],
+        "positivas": [],
+        "nao_negativas": ["preco_sugerido", "estoque_minimo", "estoque_inicial"],
+        "listas": {"unidade": UNIDADES},
+    },
+}
+
+
+def ler_arquivo(arquivo, nome):
+    """Lê CSV (separador , ou ;) ou XLSX mantendo tudo como texto"""
+    if str(nome).lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(arquivo, dtype=object)
+    else:
+        df = pd.read_csv(arquivo, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+    df.columns = [str(col).strip().lower().replace(" ", "_") for col in df.columns]
+    return df
+
+
+def _converter_numeros(serie):
+    # Aceita 1234.56 e 1.234,56
+    texto = serie.astype(str).str.strip()
+    com_virgula = texto.str.contains(",", regex=False)
+    texto = texto.where(~com_virgula, texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(texto.where(serie.notna()), errors="coerce")
+
+
+def _converter_datas(serie):
+    # Datas do Excel já chegam convertidas; texto em AAAA-MM-DD ou DD/MM/AAAA
+    texto = serie.astype(str).str.strip().str[:10]
+    datas = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    return datas.fillna(pd.to_datetime(texto, format="%d/%m/%Y", errors="coerce")).where(serie.notna())
+
+
+def validar(tabela, df, usuario=None):
+    """Separa as linhas válidas das rejeitadas.
+
+    Retorna (linhas, rejeitadas): linhas prontas para inserir_lote e um
+    DataFrame com o número da linha no arquivo e o motivo da rejeição.
+    """
+    esquema = ESQUEMAS[tabela]
+    faltando = [col for col in esquema["obrigatorias"] if col not in df.columns]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+
+    df = df.reindex(columns=COLUNAS_INSERCAO[tabela]).astype(object)
+    erros = pd.Series("", index=df.index)
+
+    def rejeitar(mascara, motivo):
+        erros.loc[mascara] = erros.loc[mascara] + motivo + "; "
+
+    # Texto sem espaços nas pontas; vazio conta como ausente
+    for col in df.columns:
+        preenchido = df[col].notna()
+        df.loc[preenchido, col] = df.loc[preenchido, col].astype(str).str.strip()
+        df.loc[df[col] == "", col] = None
+
+    for col in esquema["obrigatorias"]:
+        rejeitar(df[col].isna(), f"{col} vazio")
+
+    if "data" in df.columns:
+        datas = _converter_datas(df["data"])
+        rejeitar(df["data"].notna() & datas.isna(), "data inválida")
+        df["data"] = datas.dt.strftime("%Y-%m-%d")
+
+    for col in esquema["positivas"] + esquema["nao_negativas"]:
+        numeros = _converter_numeros(df[col])
+        rejeitar(df[col].notna() & numeros.isna(), f"{col} não numérico")
+        if col in esquema["positivas"]:
+            rejeitar(numeros <= 0, f"{col} deve ser maior que zero")
+        else:
+            rejeitar(numeros < 0, f"{col} negativo")
+        df[col] = numeros
+
+    if tabela in ("entradas", "saidas"):
+        catalogo = carregar_produtos().set_index("codigo")
+        rejeitar(df["codigo_produto"].notna() & ~df["codigo_produto"].isin(catalogo.index),
+                 "produto não cadastrado")
+        df["descricao_produto"] = df["descricao_produto"].fillna(df["codigo_produto"].map(catalogo["descricao"]))
+        df["unidade"] = df["unidade"].fillna(df["codigo_produto"].map(catalogo["unidade"]))
+        total, unitario = esquema["total"]
+        df[total] = df[total].fillna(df["quantidade"] * df[unitario])
+        df["nota_fiscal"] = df["nota_fiscal"].fillna("SEM NOTA")
+
+    if tabela == "produtos":
+        df["estoque_inicial"] = df["estoque_inicial"].fillna(0.0)
+        rejeitar(df["codigo"].isin(set(carregar_produtos()["codigo"])), "código já cadastrado")
+        rejeitar(df["codigo"].notna() & df["codigo"].duplicated(), "código repetido no arquivo")
+
+    for col, valores in esquema["listas"].items():
+        rejeitar(df[col].notna() & ~df[col].isin(valores), f"{col} inválido")
+
+    if "usuario_registro" in df.columns:
+        df["usuario_registro"] = usuario
+
+    ok = erros == ""
+    rejeitadas = pd.DataFrame({
+        "linha": df.index[~ok] + 2,  # cabeçalho é a linha 1 do arquivo
+        "motivo": erros[~ok].str.rstrip("; ")
+    })
+    validas = df[ok].astype(object)
+    linhas = list(validas.where(validas.notna(), None).itertuples(index=False, name=None))
+    return linhas, rejeitadas
+
+
+def importar(tabela, arquivo, nome, usuario=None):
+    """Valida e importa um arquivo; devolve (linhas importadas, rejeitadas)"""
+    linhas, rejeitadas = validar(tabela, ler_arquivo(arquivo, nome), usuario)
+    inseridas = inserir_lote(tabela, linhas) if linhas else 0
+    return inseridas, rejeitadas
+
+
+# ==============================
+# LINHA DE COMANDO
+# ==============================
+if __name__ == "__main__":
+    # python importacao.py TABELA ARQUIVO [USUARIO]
+    if len(sys.argv) not in (3, 4) or sys.argv[1] not in ESQUEMAS:
+        print(f"Uso: python importacao.py {{{'|'.join(ESQUEMAS)}}} ARQUIVO [USUARIO]")
+        sys.exit(2)
+    init_database()
+    usuario = sys.argv[3] if len(sys.argv) == 4 else None
+    inseridas, rejeitadas = importar(sys.argv[1], sys.argv[2], sys.argv[2], usuario)
+    for _, row in rejeitadas.iterrows():
+        print(f"linha {row['linha']}: {row['motivo']}")
+    print(f"{inseridas} linha(s) importada(s), {len(rejeitadas)} rejeitada(s)")
@@ -0,0 +1,166 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+
+# ==============================
+# PERFIL DE DESEMPENHO
+# ==============================
+# Intervalos cronometrados ("spans") em volta das consultas, escritas,
+# agregações e gráficos. Cada execução do script (rerun) do Streamlit roda
+# em uma thread própria, então os spans ficam em um threading.local e
+# iniciar_execucao() recomeça a lista a cada rerun.
+#
+# Os spans também são gravados, um JSON por linha, em PERFIL_LOG para
+# análise posterior (PERFIL_LOG vazio desliga o arquivo). Eles ficam em
+# memória e vão para o arquivo de uma vez no fim de cada execução
+# (gravar_spans), e o arquivo é rotacionado ao passar de PERFIL_LOG_MAX_MB.
+PERFIL_LOG = os.environ.get("PERFIL_LOG", "perfil.log")
+PERFIL_LOG_MAX_MB = float(os.environ.get("PERFIL_LOG_MAX_MB", "10"))
+PERFIL_LOG_ARQUIVOS = int(os.environ.get("PERFIL_LOG_ARQUIVOS", "3"))   # perfil.log.1, .2, ...
+MAX_SPANS = 2000    # limite por thread quando ninguém chama iniciar_execucao()
+MAX_PENDENTES = 1000    # spans em memória que forçam a gravação antes do fim da execução
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_pendentes = []     # linhas JSON ainda não gravadas, de todas as threads
+_logger = None
+
+
+def iniciar_execucao(usuario=None):
+    """Começa a coleta de uma nova execução (chamar no topo do app)"""
+    _local.execucao = uuid.uuid4().hex[:8]
+    _local.usuario = usuario
+    _local.inicio = time.perf_counter()
+    _local.spans = deque(maxlen=MAX_SPANS)
+    _local.pilha = []
+
+
+def _estado():
+    if not hasattr(_local, "spans"):
+        iniciar_execucao()
+    return _local
+
+
+def _log():
+    """Logger do arquivo de spans, criado no primeiro uso"""
+    global _logger
+    if _logger is None:
+        handler = RotatingFileHandler(PERFIL_LOG, maxBytes=int(PERFIL_LOG_MAX_MB * 1024 * 1024),
+                                      backupCount=PERFIL_LOG_ARQUIVOS, encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger("perfil")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def _guardar(estado, span):
+    if not PERFIL_LOG:
+        return
+    registro = {
+        "quando": datetime.now().isoformat(timespec="milliseconds"),
+        "execucao": estado.execucao,
+        "usuario": estado.usuario,
+        **span,
+    }
+    linha = json.dumps(registro, ensure_ascii=False, default=str)
+    with _log_lock:
+        _pendentes.append(linha)
+        cheio = len(_pendentes) >= MAX_PENDENTES
+    if cheio:
+        gravar_spans()
+
+
+def gravar_spans():
+    """Grava em PERFIL_LOG, numa única escrita, os spans pendentes
+    (chamar no fim de cada execução do app)"""
+    global _pendentes
+    with _log_lock:
+        linhas, _pendentes = _pendentes, []
+        if not linhas:
+            return
+        logger = _log()
+    # O handler não propaga erros de arquivo: o log nunca derruba a página
+    logger.info("\n".join(linhas))
+
+
+atexit.register(gravar_spans)
+
+
+@contextmanager
+def medir(nome, **detalhes):
+    """Cronometra o bloco; o dict devolvido aceita linhas, bytes etc."""
+    estado = _estado()
+    span = {"nome": nome, "nivel": len(estado.pilha), **detalhes}
+    estado.spans.append(span)       # na ordem de início, para mostrar aninhado
+    estado.pilha.append(span)
+    inicio = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span["ms"] = (time.perf_counter() - inicio) * 1000
+        estado.pilha.pop()
+        _guardar(estado, span)
+
+
+def anotar(**detalhes):
+    """Acrescenta informações ao span aberto mais interno"""
+    estado = _estado()
+    if estado.pilha:
+        estado.pilha[-1].update(detalhes)
+
+
+def _descrever_resultado(span, resultado, conta_linhas):
+    # carregar_historico devolve (df, cursor)
+    if isinstance(resultado, tuple) and resultado and isinstance(resultado[0], pd.DataFrame):
+        resultado = resultado[0]
+    if isinstance(resultado, pd.DataFrame):
+        span["linhas"] = len(resultado)
+        # Sem deep=True: medir strings uma a uma custaria mais que a própria leitura
+        span["bytes"] = int(resultado.memory_usage(index=True).sum())
+    elif conta_linhas:
+        span["linhas"] = resultado
+
+
+def medido(nome=None, conta_linhas=False):
+    """Decorador: cronometra cada chamada e anota linhas/bytes do resultado.
+
+    DataFrames sempre informam linhas e bytes; conta_linhas=True quando a
+    função devolve o número de linhas gravadas (inteiros como ids não contam).
+    """
+    def decorar(funcao):
+        rotulo = nome or funcao.__name__
+
+        @functools.wraps(funcao)
+        def envolver(*args, **kwargs):
+            with medir(rotulo) as span:
+                resultado = funcao(*args, **kwargs)
+                _descrever_resultado(span, resultado, conta_linhas)
+                return resultado
+        return envolver
+    return decorar
+
+
+def spans_da_execucao():
+    """DataFrame com os spans concluídos da execução atual"""
+    estado = _estado()
+    linhas = [span for span in estado.spans if "ms" in span]
+    return pd.DataFrame(linhas, columns=["nome", "nivel", "ms", "linhas", "bytes", "cache"])
+
+
+def tempo_execucao_ms():
+    """Tempo desde iniciar_execucao()"""
+    return (time.perf_counter() - _estado().inicio) * 1000
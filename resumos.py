@@ -0,0 +1,173 @@
+# ==============================
+# RESUMOS DIÁRIOS
+# ==============================
+# Totais por dia mantidos pelas próprias inserções/exclusões, para que os
+# KPIs de qualquer período somem no máximo algumas centenas de linhas.
+# As funções recebem o cursor da transação de escrita de banco.py.
+from conexoes import BACKEND
+
+# Coluna de valor de cada tabela de movimento
+COLUNAS_VALOR = {"entradas": "custo_total", "saidas": "total_venda", "gastos": "valor"}
+
+NOTAS_VAZIAS = ["", "SEM NOTA", "sem nota", "Sem nota"]
+
+# Mesma regra de tem_nota_fiscal(), para reconstruir os resumos em SQL
+SQL_TEM_NOTA = (
+    f"CASE WHEN {BACKEND.e_texto('nota_fiscal')} AND TRIM(nota_fiscal) NOT IN ("
+    + ", ".join(f"'{n}'" for n in NOTAS_VAZIAS)
+    + ") THEN 1 ELSE 0 END"
+)
+
+
+def tem_nota_fiscal(nota_fiscal):
+    """Com nota fiscal: texto preenchido e diferente de "SEM NOTA" """
+    return isinstance(nota_fiscal, str) and nota_fiscal.strip() not in NOTAS_VAZIAS
+
+
+def criar_tabelas(cursor):
+    # Por dia, tabela de movimento e com/sem nota
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumo_diario (
+            data DATE NOT NULL,
+            tabela TEXT NOT NULL,
+            com_nota INTEGER NOT NULL,
+            registros INTEGER NOT NULL DEFAULT 0,
+            quantidade REAL NOT NULL DEFAULT 0,
+            valor REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, tabela, com_nota)
+        )
+    """)
+
+    # Por dia e produto (entradas e saídas)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumo_diario_produto (
+            data DATE NOT NULL,
+            tabela TEXT NOT NULL,
+            codigo_produto TEXT NOT NULL,
+            com_nota INTEGER NOT NULL,
+            registros INTEGER NOT NULL DEFAULT 0,
+            quantidade REAL NOT NULL DEFAULT 0,
+            valor REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, tabela, codigo_produto, com_nota)
+        )
+    """)
+
+    # Por dia e categoria de gasto
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumo_diario_categoria (
+            data DATE NOT NULL,
+            categoria TEXT NOT NULL,
+            registros INTEGER NOT NULL DEFAULT 0,
+            valor REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, categoria)
+        )
+    """)
+
+
+def registrar(cursor, tabela, data, valor, quantidade=0.0, codigo_produto=None,
+              nota_fiscal=None, categoria=None, sinal=1):
+    """Soma (sinal=1) ou desconta (sinal=-1) um movimento nos resumos do dia"""
+    dia = str(data)[:10]
+    com_nota = int(tem_nota_fiscal(nota_fiscal))
+    registros, quantidade, valor = sinal, sinal * quantidade, sinal * valor
+
+    cursor.execute("""
+        INSERT INTO resumo_diario (data, tabela, com_nota, registros, quantidade, valor)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (data, tabela, com_nota) DO UPDATE SET
+            registros = resumo_diario.registros + excluded.registros,
+            quantidade = resumo_diario.quantidade + excluded.quantidade,
+            valor = resumo_diario.valor + excluded.valor
+    """, (dia, tabela, com_nota, registros, quantidade, valor))
+
+    if codigo_produto is not None:
+        cursor.execute("""
+            INSERT INTO resumo_diario_produto (data, tabela, codigo_produto, com_nota,
+                                               registros, quantidade, valor)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (data, tabela, codigo_produto, com_nota) DO UPDATE SET
+                registros = resumo_diario_produto.registros + excluded.registros,
+                quantidade = resumo_diario_produto.quantidade + excluded.quantidade,
+                valor = resumo_diario_produto.valor + excluded.valor
+        """, (dia, tabela, codigo_produto, com_nota, registros, quantidade, valor))
+
+    if categoria is not None:
+        cursor.execute("""
+            INSERT INTO resumo_diario_categoria (data, categoria, registros, valor)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (data, categoria) DO UPDATE SET
+                registros = resumo_diario_categoria.registros + excluded.registros,
+                valor = resumo_diario_categoria.valor + excluded.valor
+        """, (dia, categoria, registros, valor))
+
+    if sinal < 0:
+        for resumo in ["resumo_diario", "resumo_diario_produto", "resumo_diario_categoria"]:
+            cursor.execute(f"DELETE FROM {resumo} WHERE data = ? AND registros <= 0", (dia,))
+
+
+def registrar_novos(cursor, tabela, apos_id=0, origem=None):
+    """Soma nos resumos, de uma vez, as linhas de `tabela` com id > apos_id.
+
+    Usado na importação em lote (um GROUP BY por lote em vez de um
+    UPSERT por linha) e, com apos_id=0, para reconstruir tudo. `origem`
+    lê as linhas de outra tabela com as mesmas colunas (o arquivo mensal).
+    """
+    origem = origem or tabela
+    if tabela in ("entradas", "saidas"):
+        valor = COLUNAS_VALOR[tabela]
+        cursor.execute(f"""
+            INSERT INTO resumo_diario_produto (data, tabela, codigo_produto, com_nota,
+                                               registros, quantidade, valor)
+            SELECT {BACKEND.dia('data')}, '{tabela}', codigo_produto, {SQL_TEM_NOTA},
+                   COUNT(*), SUM(quantidade), SUM({valor})
+            FROM {origem}
+            WHERE id > ?
+            GROUP BY 1, 3, 4
+            ON CONFLICT (data, tabela, codigo_produto, com_nota) DO UPDATE SET
+                registros = resumo_diario_produto.registros + excluded.registros,
+                quantidade = resumo_diario_produto.quantidade + excluded.quantidade,
+                valor = resumo_diario_produto.valor + excluded.valor
+        """, (apos_id,))
+        cursor.execute(f"""
+            INSERT INTO resumo_diario (data, tabela, com_nota, registros, quantidade, valor)
+            SELECT {BACKEND.dia('data')}, '{tabela}', {SQL_TEM_NOTA},
+                   COUNT(*), SUM(quantidade), SUM({valor})
+            FROM {origem}
+            WHERE id > ?
+            GROUP BY 1, 3
+            ON CONFLICT (data, tabela, com_nota) DO UPDATE SET
+                registros = resumo_diario.registros + excluded.registros,
+                quantidade = resumo_diario.quantidade + excluded.quantidade,
+                valor = resumo_diario.valor + excluded.valor
+        """, (apos_id,))
+    elif tabela == "gastos":
+        cursor.execute(f"""
+            INSERT INTO resumo_diario_categoria (data, categoria, registros, valor)
+            SELECT {BACKEND.dia('data')}, categoria, COUNT(*), SUM(valor)
+            FROM {origem}
+            WHERE id > ?
+            GROUP BY 1, 2
+            ON CONFLICT (data, categoria) DO UPDATE SET
+                registros = resumo_diario_categoria.registros + excluded.registros,
+                valor = resumo_diario_categoria.valor + excluded.valor
+        """, (apos_id,))
+        cursor.execute(f"""
+            INSERT INTO resumo_diario (data, tabela, com_nota, registros, quantidade, valor)
+            SELECT {BACKEND.dia('data')}, 'gastos', 0, COUNT(*), 0, SUM(valor)
+            FROM {origem}
+            WHERE id > ?
+            GROUP BY 1
+            ON CONFLICT (data, tabela, com_nota) DO UPDATE SET
+                registros = resumo_diario.registros + excluded.registros,
+                valor = resumo_diario.valor + excluded.valor
+        """, (apos_id,))
+
+
+def reconstruir(cursor, arquivo=True):
+    """Refaz todos os resumos a partir das tabelas de movimento (e do arquivo mensal)"""
+    for resumo in ["resumo_diario", "resumo_diario_produto", "resumo_diario_categoria"]:
+        cursor.execute(f"DELETE FROM {resumo}")
+    for tabela in COLUNAS_VALOR:
+        registrar_novos(cursor, tabela)
+        if arquivo:
+            registrar_novos(cursor, tabela, origem=f"{tabela}_arquivo")
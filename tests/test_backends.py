@@ -0,0 +1,141 @@
+"""Os mesmos fluxos de ponta a ponta no SQLite e no PostgreSQL.
+
+BACKEND é escolhido na importação (DATABASE_URL), então cada backend roda
+o fluxo em um processo próprio. O SQLite sempre roda; o PostgreSQL roda
+quando TEST_DATABASE_URL aponta para um servidor (um PostgreSQL local
+descartável serve), em um schema criado e apagado pelo teste.
+
+    TEST_DATABASE_URL=postgresql://usuario@localhost/teste python -m pytest tests
+"""
+import json
+import os
+import subprocess
+import sys
+import uuid
+from datetime import date
+from urllib.parse import quote
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MES_ARQUIVADO = "2024-01"
+
+
+def executar_fluxo():
+    """Cadastro, movimentos, pedido, importação, busca, exportação e
+    arquivamento; devolve os números conferidos pelos testes."""
+    import banco
+    from exportacao import exportar
+
+    banco.init_database()
+    banco.inserir_produto("CIM01", "Cimento CP II 50kg", "saco", 35.0, 10, 100)
+    banco.inserir_produto("ARE01", "Areia média", "m³", 120.0, 2, 20)
+
+    hoje = str(date.today())
+    banco.inserir_entrada(f"{MES_ARQUIVADO}-10", "CIM01", "Cimento CP II 50kg", "saco", 50, "Forn",
+                          30.0, 1500.0, "NF-1", "PIX", "", "admin")
+    banco.inserir_saida(f"{MES_ARQUIVADO}-15", "CIM01", "Cimento CP II 50kg", "saco", 20, "Cli",
+                        35.0, 700.0, "SEM NOTA", "PIX", "", "admin")
+    banco.inserir_saida(hoje, "ARE01", "Areia média", "m³", 5, "Cli",
+                        120.0, 600.0, "NF-2", "PIX", "", "admin")
+    banco.inserir_gasto(hoje, "Combustíveis", "Diesel", "Posto", 250.0, "PIX", "", "admin")
+    banco.inserir_pedido("saidas", hoje, "Cli", "NF-3", "PIX", "", "admin",
+                         [("CIM01", 10, 36.0), ("ARE01", 1, 125.0)])
+    # Carga em lote: executemany no SQLite, COPY no PostgreSQL
+    banco.inserir_lote("entradas", [
+        (hoje, "ARE01", "Areia média", "m³", 3, "Forn, \"filial\"", 100.0, 300.0, "", "PIX", None, "admin")
+    ])
+
+    estoque = banco.calcular_estoque_atual().set_index("codigo")["estoque_atual"].to_dict()
+    resumo = banco.carregar_resumo_periodo()
+    totais = resumo.groupby("tabela")["valor"].sum().round(2).to_dict()
+    busca = banco.buscar_produtos("cimento")["codigo"].tolist()
+
+    with banco.conexao() as conn:
+        linhas_lotes = sum(len(linhas) for _, linhas in
+                           banco.BACKEND.ler_em_lotes(conn, "SELECT id FROM saidas", (), 2))
+    caminho = exportar("csv")
+    exportou = os.path.getsize(caminho) > 0
+    os.remove(caminho)
+
+    movidos = banco.arquivar_meses(MES_ARQUIVADO)
+    historico = banco.carregar_historico("saidas", limite=3)
+    pagina2 = banco.carregar_historico("saidas", limite=3, apos=historico[1])[0]
+    arquivada = int(pagina2["id"].iloc[-1])
+    estoque_apos_arquivo = banco.calcular_estoque_atual().set_index("codigo")["estoque_atual"].to_dict()
+    totais_apos_arquivo = banco.carregar_resumo_periodo().groupby("tabela")["valor"].sum().round(2).to_dict()
+    # Registro arquivado excluído pelo histórico
+    banco.excluir_saida(arquivada)
+
+    return {
+        "backend": banco.BACKEND.nome,
+        "estoque": estoque,
+        "totais": totais,
+        "busca": busca,
+        "linhas_lotes": linhas_lotes,
+        "exportou": exportou,
+        "movidos": movidos,
+        "estoque_apos_arquivo": estoque_apos_arquivo,
+        "totais_apos_arquivo": totais_apos_arquivo,
+        "historico": [len(historico[0]), len(pagina2)],
+        "divergencias": banco.conferir_arquivo(),
+        "estoque_apos_exclusao": banco.calcular_estoque_atual().set_index("codigo")["estoque_atual"].to_dict(),
+        "totais_apos_exclusao": banco.carregar_resumo_periodo().groupby("tabela")["valor"].sum().round(2).to_dict(),
+    }
+
+
+def _rodar(url, pasta):
+    ambiente = dict(os.environ, DATABASE_URL=url, EXPORTACOES_DIR=str(pasta),
+                    PYTHONPATH=os.pathsep.join([RAIZ, os.path.dirname(__file__)]))
+    saida = subprocess.run(
+        [sys.executable, "-c", "import json, test_backends; print(json.dumps(test_backends.executar_fluxo()))"],
+        cwd=pasta, env=ambiente, capture_output=True, text=True, timeout=300
+    )
+    assert saida.returncode == 0, saida.stderr
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+@pytest.fixture
+def url_postgres():
+    base = os.environ.get("TEST_DATABASE_URL")
+    if not base:
+        pytest.skip("TEST_DATABASE_URL não definido")
+    psycopg2 = pytest.importorskip("psycopg2")
+    schema = f"teste_{uuid.uuid4().hex[:8]}"
+    conn = psycopg2.connect(base)
+    conn.autocommit = True
+    conn.cursor().execute(f"CREATE SCHEMA {schema}")
+    separador = "&" if "?" in base else "?"
+    try:
+        yield f"{base}{separador}options={quote(f'-csearch_path={schema}')}"
+    finally:
+        conn.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+
+def _conferir(resultado):
+    assert resultado["estoque"] == {"CIM01": 120.0, "ARE01": 17.0}
+    assert resultado["totais"] == {"entradas": 1800.0, "saidas": 1785.0, "gastos": 250.0}
+    assert resultado["busca"] == ["CIM01"]
+    assert resultado["linhas_lotes"] == 4
+    assert resultado["exportou"]
+    assert resultado["movidos"] == {"entradas": 1, "saidas": 1, "gastos": 0}
+    assert resultado["estoque_apos_arquivo"] == resultado["estoque"]
+    assert resultado["totais_apos_arquivo"] == resultado["totais"]
+    # 4 saídas, uma delas arquivada: o histórico pagina pelas quatro
+    assert resultado["historico"] == [3, 1]
+    assert resultado["divergencias"] == []
+    assert resultado["estoque_apos_exclusao"] == {"CIM01": 140.0, "ARE01": 17.0}
+    assert resultado["totais_apos_exclusao"] == {"entradas": 1800.0, "saidas": 1085.0, "gastos": 250.0}
+
+
+def test_fluxo_sqlite(tmp_path):
+    resultado = _rodar(str(tmp_path / "controle.db"), tmp_path)
+    assert resultado["backend"] == "sqlite"
+    _conferir(resultado)
+
+
+def test_fluxo_postgres(tmp_path, url_postgres):
+    resultado = _rodar(url_postgres, tmp_path)
+    assert resultado["backend"] == "postgres"
+    _conferir(resultado)